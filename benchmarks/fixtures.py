@@ -0,0 +1,208 @@
+"""Synthetic images, a SQLite database and a local bucket for benchmarks."""
+from __future__ import annotations
+
+import hashlib
+import shutil
+import sqlite3
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import tifffile
+
+from benchmarks.normalize_benchmark import synthetic_volume
+
+IMAGE_SIZES = {
+    "small": {
+        "ht": (32, 256, 256),
+        "mip": (256, 256),
+        "bf": (512, 512, 3),
+    },
+    "realistic": {
+        "ht": (96, 768, 768),
+        "mip": (768, 768),
+        "bf": (1536, 1536, 3),
+    },
+}
+DATABASE_SIZES = {
+    "small": {"patients": 10, "cells_per_type": 20},
+    "realistic": {"patients": 60, "cells_per_type": 80},
+}
+CELL_TYPES = ["CD4", "CD8", "Mono", "Neutro"]
+IMAGE_NAMES = {
+    "HOLOTOMOGRAPHY": "RI Tomogram.tiff",
+    "MIP": "RI MIP.tiff",
+    "BRIGHT_FIELD": "BF.tiff",
+}
+
+# Modules that import query_database by name.
+QUERY_MODULES = [
+    "src.image",
+    "src.overview",
+    "src.progress",
+    "src.query_cache",
+    "src.work_queue",
+]
+
+
+def write_synthetic_images(root: Path, size: str = "small") -> dict:
+    """HT stack, MIP and bright field TIFFs shaped like the microscope's."""
+    shapes = IMAGE_SIZES[size]
+    root.mkdir(parents=True, exist_ok=True)
+    ht = synthetic_volume(shapes["ht"])
+    rng = np.random.default_rng(1)
+    paths = {
+        "HOLOTOMOGRAPHY": root / IMAGE_NAMES["HOLOTOMOGRAPHY"],
+        "MIP": root / IMAGE_NAMES["MIP"],
+        "BRIGHT_FIELD": root / IMAGE_NAMES["BRIGHT_FIELD"],
+    }
+    tifffile.imwrite(paths["HOLOTOMOGRAPHY"], ht)
+    tifffile.imwrite(paths["MIP"], synthetic_volume((1, *shapes["mip"]))[0])
+    tifffile.imwrite(
+        paths["BRIGHT_FIELD"],
+        rng.integers(0, 256, size=shapes["bf"], dtype=np.uint8),
+        photometric="rgb",
+    )
+    return paths
+
+
+class SQLiteDatabase:
+    """Project-shaped tables in SQLite, queried with the app's MySQL SQL."""
+
+    def __init__(self, path: str = ":memory:"):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+
+    def query(self, sql: str, args=None) -> list[dict]:
+        cursor = self.connection.execute(sql.replace("%s", "?"), args or ())
+        return [dict(row) for row in cursor.fetchall()]
+
+    def seed(
+        self,
+        project_name: str,
+        patients: int,
+        cells_per_type: int,
+        labelled_fraction: float = 0.5,
+        seed: int = 0,
+    ) -> None:
+        rng = np.random.default_rng(seed)
+        self.connection.executescript(
+            f"""
+            CREATE TABLE {project_name}_patient (
+                patient_id INTEGER PRIMARY KEY,
+                project_id INTEGER,
+                google_drive_parent_name TEXT);
+            CREATE TABLE {project_name}_cell (
+                cell_id INTEGER PRIMARY KEY,
+                patient_id INTEGER,
+                cell_type TEXT,
+                cell_number INTEGER);
+            CREATE INDEX {project_name}_cell_patient
+                ON {project_name}_cell (patient_id, cell_type, cell_number);
+            CREATE TABLE {project_name}_image (
+                image_id INTEGER PRIMARY KEY,
+                patient_id INTEGER,
+                cell_id INTEGER,
+                image_type TEXT,
+                file_name TEXT);
+            CREATE INDEX {project_name}_image_cell
+                ON {project_name}_image (cell_id);
+            CREATE TABLE {project_name}_image_quality (
+                image_id INTEGER PRIMARY KEY,
+                quality INTEGER);
+            CREATE TABLE {project_name}_image_center (
+                image_id INTEGER PRIMARY KEY,
+                x INTEGER,
+                y INTEGER,
+                z INTEGER);
+            """
+        )
+
+        patient_rows, cell_rows, image_rows = [], [], []
+        quality_rows, center_rows = [], []
+        for patient_id in range(1, patients + 1):
+            patient_name = f"2022{patient_id:04d}"
+            patient_rows.append((patient_id, 1, patient_name))
+            for cell_type in CELL_TYPES:
+                for cell_number in range(1, cells_per_type + 1):
+                    cell_id = len(cell_rows) + 1
+                    cell_rows.append(
+                        (cell_id, patient_id, cell_type, cell_number)
+                    )
+                    for image_type, suffix in IMAGE_NAMES.items():
+                        image_id = len(image_rows) + 1
+                        image_rows.append(
+                            (
+                                image_id,
+                                patient_id,
+                                cell_id,
+                                image_type,
+                                f"{patient_name}.{cell_type}-"
+                                f"{cell_number:03d}_{suffix}",
+                            )
+                        )
+                        if rng.random() < labelled_fraction:
+                            quality_rows.append(
+                                (image_id, int(rng.integers(0, 2)))
+                            )
+                        if (
+                            image_type == "HOLOTOMOGRAPHY"
+                            and rng.random() < labelled_fraction
+                        ):
+                            center_rows.append((image_id, 128, 128, 16))
+
+        for table, rows in [
+            ("patient", patient_rows),
+            ("cell", cell_rows),
+            ("image", image_rows),
+            ("image_quality", quality_rows),
+            ("image_center", center_rows),
+        ]:
+            placeholders = ", ".join(["?"] * len(rows[0]))
+            self.connection.executemany(
+                f"INSERT INTO {project_name}_{table} "
+                f"VALUES ({placeholders})",
+                rows,
+            )
+        self.connection.commit()
+
+
+@contextmanager
+def sqlite_backend(database: SQLiteDatabase):
+    """Route the app's query_database calls to the SQLite stand-in."""
+    with ExitStack() as stack:
+        for module in QUERY_MODULES:
+            stack.enter_context(
+                mock.patch(f"{module}.query_database", database.query)
+            )
+        yield database
+
+
+class LocalBucket:
+    """S3Bucket's interface on a local directory."""
+
+    def __init__(self, root: Path, name: str = "benchmark-bucket"):
+        self.root = root
+        self.name = name
+
+    def e_tag(self, key: str) -> str:
+        stat = (self.root / key).stat()
+        return hashlib.md5(
+            f"{stat.st_size}-{stat.st_mtime_ns}".encode()
+        ).hexdigest()
+
+    def size(self, key: str) -> int:
+        return (self.root / key).stat().st_size
+
+    def get_range(self, key: str, start: int, length: int) -> bytes:
+        with open(self.root / key, "rb") as f:
+            f.seek(start)
+            return f.read(length)
+
+    def download_file(self, key: str, filename: str) -> None:
+        shutil.copyfile(self.root / key, filename)
+
+    def download_fileobj(self, key: str, fileobj) -> None:
+        with open(self.root / key, "rb") as source:
+            shutil.copyfileobj(source, fileobj)
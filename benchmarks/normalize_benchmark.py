@@ -0,0 +1,75 @@
+"""Compare the normalization engine with the original float64 expression.
+
+    python -m benchmarks.normalize_benchmark --shape 96x1024x1024
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from src.normalize import normalize_to_uint8
+
+DEFAULT_SHAPES = ["48x512x512", "96x768x768"]
+
+
+def reference_normalize(img: np.ndarray) -> np.ndarray:
+    """TomocubeImage.process before the normalization engine."""
+    img = (img - np.min(img)) / (np.max(img) - np.min(img)) * 255
+    return img.astype(np.uint8)
+
+
+def synthetic_volume(shape: tuple[int, ...], seed: int = 0) -> np.ndarray:
+    """uint16 refractive-index-like stack: smooth background plus noise."""
+    rng = np.random.default_rng(seed)
+    volume = rng.normal(13370, 40, size=shape)
+    volume[
+        :, shape[1] // 4 : shape[1] // 2, shape[2] // 4 : shape[2] // 2
+    ] += 300
+    return volume.astype(np.uint16)
+
+
+def measure(func, img: np.ndarray, repeat: int) -> tuple[float, float]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(img)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(img)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1024**2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shape", action="append", dest="shapes")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    candidates = {
+        "reference": reference_normalize,
+        "engine": normalize_to_uint8,
+        "engine p0.5-99.5": lambda img: normalize_to_uint8(
+            img, clip_percentiles=(0.5, 99.5)
+        ),
+    }
+
+    print(f"{'shape':>14} {'method':>18} {'time (s)':>10} {'peak (MB)':>10}")
+    for shape_text in args.shapes or DEFAULT_SHAPES:
+        shape = tuple(int(v) for v in shape_text.split("x"))
+        img = synthetic_volume(shape)
+        assert np.array_equal(
+            reference_normalize(img), normalize_to_uint8(img)
+        )
+        for name, func in candidates.items():
+            seconds, peak = measure(func, img, args.repeat)
+            print(
+                f"{shape_text:>14} {name:>18} {seconds:>10.3f} {peak:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Download throughput from S3 with boto3 defaults and the tuned settings.
+
+    python -m benchmarks.s3_throughput 2022-tomocube-igra \
+        "20220822/20220822.121301.809.CD4-001_RI Tomogram.tiff"
+
+Needs AWS_KEY and AWS_PASSWORD. "default" is a client with boto3's
+default pool (10 connections) and TransferConfig (10 threads), as the
+per-rerun resources had; "tuned" is the shared bucket from src.s3.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+
+from src.s3 import (
+    AWS_KEY,
+    AWS_PASSWORD,
+    S3Bucket,
+    S3Credential,
+    get_s3_bucket,
+)
+
+
+def measure(bucket: S3Bucket, key: str, repeat: int) -> tuple[float, int]:
+    best = float("inf")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "object")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            bucket.download_file(key, path)
+            best = min(best, time.perf_counter() - start)
+        size = os.path.getsize(path)
+    return best, size
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("bucket")
+    parser.add_argument("key")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    credential = S3Credential(AWS_KEY, AWS_PASSWORD)
+    default_client = boto3.client(
+        "s3",
+        aws_access_key_id=credential.key,
+        aws_secret_access_key=credential.password,
+    )
+    candidates = {
+        "default": S3Bucket(default_client, args.bucket, TransferConfig()),
+        "tuned": get_s3_bucket(credential, args.bucket),
+    }
+
+    print(f"{'config':>8} {'time (s)':>10} {'MB/s':>8}")
+    for name, bucket in candidates.items():
+        seconds, size = measure(bucket, args.key, args.repeat)
+        print(f"{name:>8} {seconds:>10.2f} {size / seconds / 1024**2:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""Time and peak memory of the image, database and download hot paths.
+
+    python -m benchmarks.suite --size realistic --save baseline.json
+    python -m benchmarks.suite --size realistic --compare baseline.json
+
+Images are synthetic TIFFs, the database is a seeded SQLite copy of a
+project's tables and S3 is a local directory, so runs are reproducible
+without network or credentials. --compare exits with status 1 when an
+operation is slower (or uses more memory) than the baseline by more than
+--tolerance.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from benchmarks.fixtures import (
+    DATABASE_SIZES,
+    IMAGE_NAMES,
+    LocalBucket,
+    SQLiteDatabase,
+    sqlite_backend,
+    write_synthetic_images,
+)
+from src.cache import ImageCache
+from src.cell_number_selector import CellNumberRenderer
+from src.cell_type_selector import CellTypeRenderer
+from src.chunked import CHUNK_SHAPE, ChunkedVolume, write_chunked
+from src.image import BFImage, CellImageMeta, HTVolume, TomocubeImage
+from src.overview import OverviewTable
+from src.patient_id_selector import PatientListRenderer
+from src.projection import project_volume
+from src.pyramid import ImagePyramid
+from src.query_cache import get_query_cache
+from src.s3 import S3Downloader
+from src.thumbnail import THUMBNAIL_WIDTH, make_thumbnails
+from src.work_queue import WorkQueue
+
+PROJECT_NAME = "benchmark"
+PATIENT_NAME = "20220001"
+
+
+@dataclass
+class Result:
+    name: str
+    seconds: float
+    peak_mb: float
+
+
+def measure(
+    name: str,
+    func: Callable[[], object],
+    repeat: int,
+    setup: Optional[Callable[[], object]] = None,
+) -> Result:
+    """Best wall time of repeat runs and the peak of one traced run."""
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return Result(name, best, peak / 1024**2)
+
+
+def image_benchmarks(paths: dict, repeat: int) -> list[Result]:
+    ht_path = paths["HOLOTOMOGRAPHY"]
+    ht = TomocubeImage(ht_path).read_image()
+    processed = TomocubeImage.normalize_img(ht)
+    mip = TomocubeImage(paths["MIP"]).process()
+    volume = HTVolume(ht_path)
+    center = [n // 2 for n in ht.shape]
+    chunked_path = ht_path.with_suffix(".tchk")
+    depth = CHUNK_SHAPE[0]
+
+    def write():
+        write_chunked(
+            chunked_path,
+            (processed[z : z + depth] for z in range(0, ht.shape[0], depth)),
+            ht.shape,
+        )
+
+    results = [
+        measure("image.ht.read", TomocubeImage(ht_path).read_image, repeat),
+        measure("image.ht.process", TomocubeImage(ht_path).process, repeat),
+        measure(
+            "image.ht.normalize_img",
+            lambda: TomocubeImage.normalize_img(ht),
+            repeat,
+        ),
+        measure(
+            "image.mip.process", TomocubeImage(paths["MIP"]).process, repeat
+        ),
+        measure(
+            "image.bf.process", BFImage(paths["BRIGHT_FIELD"]).process, repeat
+        ),
+        measure("image.mip.pyramid", lambda: ImagePyramid(mip), repeat),
+        measure(
+            "image.mip.thumbnails",
+            lambda: make_thumbnails([mip] * 48, THUMBNAIL_WIDTH),
+            repeat,
+        ),
+        measure("image.ht.volume_open", lambda: HTVolume(ht_path), repeat),
+        measure("image.ht.chunked_write", write, repeat),
+        measure(
+            "image.ht.projections", lambda: project_volume(volume), repeat
+        ),
+    ]
+    for axis, name in enumerate(["xy", "zx", "zy"]):
+        results += [
+            measure(
+                f"image.ht.slice_axis.{name}",
+                lambda: TomocubeImage.image_for_streamlit(
+                    processed, center[axis], axis
+                ),
+                repeat,
+            ),
+            measure(
+                f"image.ht.volume_take.{name}",
+                lambda: volume.take(center[axis], axis),
+                repeat,
+            ),
+            # A fresh volume each run so its chunk cache starts empty.
+            measure(
+                f"image.ht.chunked_take.{name}",
+                lambda: ChunkedVolume(chunked_path).take(center[axis], axis),
+                repeat,
+            ),
+        ]
+    volume.close()
+    return results
+
+
+def database_benchmarks(size: str, repeat: int) -> list[Result]:
+    database = SQLiteDatabase()
+    database.seed(PROJECT_NAME, **DATABASE_SIZES[size])
+    clear = get_query_cache().clear
+
+    with sqlite_backend(database):
+        return [
+            measure(
+                "db.selector.patients",
+                lambda: PatientListRenderer("", PROJECT_NAME),
+                repeat,
+                clear,
+            ),
+            measure(
+                "db.selector.cell_types",
+                lambda: CellTypeRenderer("", PROJECT_NAME, 1),
+                repeat,
+                clear,
+            ),
+            measure(
+                "db.selector.cell_numbers",
+                lambda: CellNumberRenderer("", PROJECT_NAME, 1, "CD4"),
+                repeat,
+                clear,
+            ),
+            measure(
+                "db.cell_images",
+                lambda: CellImageMeta.from_cell_metadata(
+                    PROJECT_NAME, 1, "CD4", 1
+                ),
+                repeat,
+                clear,
+            ),
+            measure(
+                "db.work_queue.quality",
+                lambda: WorkQueue(PROJECT_NAME, "quality"),
+                repeat,
+            ),
+            measure(
+                "db.work_queue.center",
+                lambda: WorkQueue(PROJECT_NAME, "center"),
+                repeat,
+            ),
+            measure(
+                "db.overview",
+                lambda: OverviewTable(PROJECT_NAME).to_frame(),
+                repeat,
+            ),
+        ]
+
+
+def download_benchmarks(root: Path, paths: dict, repeat: int) -> list[Result]:
+    bucket_root = root / "bucket"
+    (bucket_root / PATIENT_NAME).mkdir(parents=True)
+    for path in paths.values():
+        (bucket_root / PATIENT_NAME / path.name).write_bytes(path.read_bytes())
+
+    cache_root = root / "cache"
+    cache = ImageCache(cache_root, max_bytes=10 * 1024**3)
+    downloader = S3Downloader(LocalBucket(bucket_root), cache)
+    ht_name = IMAGE_NAMES["HOLOTOMOGRAPHY"]
+
+    def empty_cache():
+        for entry in cache_root.glob("*/*"):
+            entry.unlink()
+
+    results = [
+        measure(
+            "s3.download.miss",
+            lambda: downloader.download(PATIENT_NAME, ht_name),
+            repeat,
+            empty_cache,
+        ),
+        measure(
+            "s3.download.hit",
+            lambda: downloader.download(PATIENT_NAME, ht_name),
+            repeat,
+        ),
+        measure(
+            "s3.stream",
+            lambda: downloader.stream(f"{PATIENT_NAME}/{ht_name}"),
+            repeat,
+        ),
+    ]
+    downloader.revalidate = True
+    results.append(
+        measure(
+            "s3.download.revalidated_hit",
+            lambda: downloader.download(PATIENT_NAME, ht_name),
+            repeat,
+        )
+    )
+    return results
+
+
+def run(size: str, repeat: int, groups: list[str]) -> list[Result]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        paths = write_synthetic_images(root / "images", size)
+        if "image" in groups:
+            results += image_benchmarks(paths, repeat)
+        if "db" in groups:
+            results += database_benchmarks(size, repeat)
+        if "s3" in groups:
+            results += download_benchmarks(root, paths, repeat)
+    return results
+
+
+def save_baseline(path: Path, size: str, results: list[Result]) -> None:
+    baseline = {
+        "size": size,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": {r.name: asdict(r) for r in results},
+    }
+    path.write_text(json.dumps(baseline, indent=2))
+
+
+def compare_baseline(
+    path: Path, size: str, results: list[Result], tolerance: float
+) -> list[str]:
+    baseline = json.loads(path.read_text())
+    if baseline["size"] != size:
+        raise ValueError(
+            f"Baseline was recorded with --size {baseline['size']}"
+        )
+
+    regressions = []
+    for result in results:
+        previous = baseline["results"].get(result.name)
+        if previous is None:
+            continue
+        for metric in ["seconds", "peak_mb"]:
+            before, after = previous[metric], getattr(result, metric)
+            if after > before * (1 + tolerance) and after - before > 1e-3:
+                regressions.append(
+                    f"{result.name} {metric}: {before:.4f} -> {after:.4f}"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "--size", choices=list(DATABASE_SIZES), default="small"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--group",
+        action="append",
+        dest="groups",
+        choices=["image", "db", "s3"],
+    )
+    parser.add_argument("--save", type=Path)
+    parser.add_argument("--compare", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = run(args.size, args.repeat, args.groups or ["image", "db", "s3"])
+    print(f"{'operation':<32} {'time (ms)':>10} {'peak (MB)':>10}")
+    for result in results:
+        print(
+            f"{result.name:<32} {result.seconds * 1000:>10.2f} "
+            f"{result.peak_mb:>10.1f}"
+        )
+
+    if args.save:
+        save_baseline(args.save, args.size, results)
+    if args.compare:
+        regressions = compare_baseline(
+            args.compare, args.size, results, args.tolerance
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
+import uuid
 from collections import OrderedDict
 
 import streamlit as st
 
 import src.center_labeller_page as center_labeller_page
+import src.grid_labeller_page as grid_labeller_page
 import src.labelled_page as labelled_page
 import src.quality_labeller_page as quality_labeller_page
+from src.metrics import rerun_trace
+from src.renderer import TimingPanelRenderer
 
 # TODO: downloader inject to each page
 
@@ -13,6 +17,7 @@ def main():
     pages = OrderedDict(
         {
             "quality_labeller_page": quality_labeller_page.app,
+            "grid_labeller_page": grid_labeller_page.app,
             "center_labeller_page": center_labeller_page.app,
             "labelled_page": labelled_page.app,
         }
@@ -24,7 +29,20 @@ def main():
             key="page",
         )
 
-    pages[st.session_state.page]()
+    if "metrics_session_id" not in st.session_state:
+        st.session_state["metrics_session_id"] = uuid.uuid4().hex
+        st.session_state["metrics_rerun"] = 0
+    st.session_state["metrics_rerun"] += 1
+
+    with rerun_trace(
+        st.session_state["metrics_session_id"],
+        st.session_state["metrics_rerun"],
+        st.session_state.page,
+    ) as trace:
+        pages[st.session_state.page]()
+
+    with st.sidebar:
+        TimingPanelRenderer(trace).render()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+"""Download and preprocess a project's images into the local image cache.
+
+    python prewarm.py 2022_tomocube_sepsis
+    python prewarm.py 2022_tomocube_sepsis --patient 3 --patient 4
+
+Every image is downloaded, decoded and normalized in a process pool, and
+the processed arrays and grid thumbnails are cached next to the downloads
+so the labeller pages only read them. HT volumes get a chunked copy only
+when their TIFF cannot be memory-mapped. Finished image ids are appended
+to a state file, so an interrupted run resumes where it stopped.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from src.cache import IMAGE_CACHE_DIR
+from src.database import query_database
+from src.image import (
+    BFImage,
+    TomocubeImage,
+    build_chunked_volume,
+    get_image_state_key,
+    load_image,
+    load_projections,
+    open_memmap,
+)
+from src.image_source import ImageSource, create_image_source
+from src.s3 import S3Downloader
+from src.thumbnail import load_thumbnail
+
+_downloader: ImageSource | None = None
+
+
+def list_images(project_name: str, patient_ids: list[int]) -> list[dict]:
+    placeholders = ", ".join(["%s"] * len(patient_ids))
+    where = f"WHERE i.patient_id IN ({placeholders})" if patient_ids else ""
+    return query_database(
+        f"""SELECT i.image_id, i.file_name, p.google_drive_parent_name
+            FROM {project_name}_image i
+            JOIN {project_name}_patient p
+            ON i.patient_id = p.patient_id
+            {where}
+            ORDER BY i.image_id""",
+        tuple(patient_ids) or None,
+    )
+
+
+def read_done(state_file: Path) -> set[int]:
+    if not state_file.exists():
+        return set()
+    return {int(line) for line in state_file.read_text().split()}
+
+
+def _init_worker(project_name: str) -> None:
+    global _downloader
+    _downloader = create_image_source(project_name)
+    if isinstance(_downloader, S3Downloader):
+        _downloader.in_memory = False
+
+
+def _prewarm(image_id: int, patient_name: str, image_name: str) -> int:
+    state_key = get_image_state_key(image_name)
+    if state_key == "ht_image":
+        image_path = _downloader.download(patient_name, image_name)
+        if open_memmap(image_path) is None:
+            build_chunked_volume(
+                _downloader, patient_name, image_name, image_id
+            )
+        load_projections(_downloader, patient_name, image_name)
+    else:
+        load_image(_downloader, patient_name, image_name)
+        image_class = BFImage if state_key == "bf_image" else TomocubeImage
+        load_thumbnail(_downloader, patient_name, image_name, image_class)
+    return _downloader.download(patient_name, image_name).stat().st_size
+
+
+def prewarm(
+    project_name: str,
+    patient_ids: list[int],
+    workers: int,
+    state_file: Path,
+) -> None:
+    done = read_done(state_file)
+    images = [
+        image
+        for image in list_images(project_name, patient_ids)
+        if image["image_id"] not in done
+    ]
+    print(f"{len(done)} images already done, {len(images)} to go")
+
+    start = time.perf_counter()
+    total_bytes = failed = 0
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(project_name,),
+    ) as executor, open(state_file, "a") as state:
+        jobs = {
+            executor.submit(
+                _prewarm,
+                image["image_id"],
+                image["google_drive_parent_name"],
+                image["file_name"],
+            ): image
+            for image in images
+        }
+        for count, job in enumerate(as_completed(jobs), 1):
+            image = jobs[job]
+            try:
+                total_bytes += job.result()
+            except Exception:
+                failed += 1
+                logging.exception(f"Prewarm of {image['file_name']} failed")
+                continue
+            state.write(f"{image['image_id']}\n")
+            state.flush()
+
+            seconds = time.perf_counter() - start
+            print(
+                f"\r{count}/{len(images)} images, "
+                f"{count / seconds:.1f} images/s, "
+                f"{total_bytes / seconds / 1024**2:.1f} MB/s",
+                end="",
+                flush=True,
+            )
+    print(f"\nFinished in {time.perf_counter() - start:.0f}s, {failed} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("project_name")
+    parser.add_argument(
+        "--patient", type=int, action="append", dest="patient_ids"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--state-file", type=Path)
+    args = parser.parse_args()
+
+    state_file = args.state_file or Path(
+        IMAGE_CACHE_DIR, f"prewarm_{args.project_name}.done"
+    )
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    prewarm(
+        args.project_name, args.patient_ids or [], args.workers, state_file
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Bulk import of quality labels and center points.
+
+    python -m src.bulk_import quality 2022_tomocube_sepsis labels.csv
+    python -m src.bulk_import center 2022_tomocube_sepsis centers.parquet
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+
+from src.database import Database, query_database
+from src.label_events import labels_saved
+from src.label_revision import bump_revision
+
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "1000"))
+
+LABEL_COLUMNS = {
+    "quality": ["image_id", "quality"],
+    "center": ["image_id", "x", "y", "z"],
+}
+QUALITY_NAMES = {"Good": 0, "Bad": 1}
+
+
+@dataclass
+class ImportReport:
+    label_type: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else float("inf")
+
+
+def upsert_sql(project_name: str, label_type: str) -> str:
+    columns = LABEL_COLUMNS[label_type]
+    updates = ", ".join(f"{c} = VALUES({c})" for c in columns[1:])
+    return f"""INSERT INTO {project_name}_image_{label_type} ({", ".join(columns)})
+            VALUES ({", ".join(["%s"] * len(columns))})
+            ON DUPLICATE KEY UPDATE {updates}"""
+
+
+def upsert_labels(
+    database: Database,
+    project_name: str,
+    label_type: str,
+    rows: list[tuple],
+    batch_size: int = BULK_IMPORT_BATCH_SIZE,
+) -> None:
+    sql = upsert_sql(project_name, label_type)
+    for start in range(0, len(rows), batch_size):
+        database.execute_many(sql, rows[start : start + batch_size])
+
+
+def read_label_file(path: str | Path) -> pd.DataFrame:
+    if Path(path).suffix.lower() == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def validate_labels(
+    project_name: str, label_type: str, data: pd.DataFrame
+) -> pd.DataFrame:
+    columns = LABEL_COLUMNS[label_type]
+    missing = [c for c in columns if c not in data.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+
+    data = data[columns].copy()
+    if label_type == "quality":
+        data["quality"] = data["quality"].replace(QUALITY_NAMES)
+
+    _check(data, data.isna().any(axis=1), "empty values")
+    for column in columns:
+        data[column] = pd.to_numeric(data[column], errors="coerce")
+    _check(data, data.isna().any(axis=1), "non-numeric values")
+    _check(data, (data != data.round()).any(axis=1), "non-integer values")
+    data = data.astype(int)
+    _check(data, (data[columns[1:]] < 0).any(axis=1), "negative values")
+    if label_type == "quality":
+        _check(data, ~data["quality"].isin([0, 1]), "quality not 0 or 1")
+
+    image_type = "HOLOTOMOGRAPHY" if label_type == "center" else None
+    known = {
+        row["image_id"]
+        for row in query_database(
+            f"SELECT image_id FROM {project_name}_image"
+            + ("" if image_type is None else " WHERE image_type = %s"),
+            None if image_type is None else (image_type,),
+        )
+    }
+    _check(data, ~data["image_id"].isin(known), "unknown image_id")
+
+    return data.drop_duplicates("image_id", keep="last")
+
+
+def _check(data: pd.DataFrame, invalid: pd.Series, reason: str) -> None:
+    if invalid.any():
+        rows = data.index[invalid].tolist()
+        raise ValueError(f"{len(rows)} rows with {reason}: {rows[:10]}")
+
+
+def import_labels(
+    project_name: str, label_type: str, data: pd.DataFrame
+) -> ImportReport:
+    start = time.perf_counter()
+    data = validate_labels(project_name, label_type, data)
+    rows = list(data.itertuples(index=False, name=None))
+
+    with Database() as database, database.transaction():
+        upsert_labels(database, project_name, label_type, rows)
+    # labels_saved only updates this process; the revision tells the
+    # Streamlit server to rebuild its in-memory indexes, which drops the
+    # labelled cells from its sessions' leases.
+    labels_saved(project_name, label_type, data["image_id"].tolist())
+    bump_revision(project_name, label_type)
+
+    report = ImportReport(label_type, len(rows), time.perf_counter() - start)
+    logging.info(
+        f"Imported {report.rows} {label_type} labels into {project_name} "
+        f"({report.rows_per_second:.0f} rows/s)"
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("label_type", choices=list(LABEL_COLUMNS))
+    parser.add_argument("project_name")
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    report = import_labels(
+        args.project_name, args.label_type, read_label_file(args.path)
+    )
+    print(
+        f"{report.rows} rows in {report.seconds:.2f}s "
+        f"({report.rows_per_second:.0f} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
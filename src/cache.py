@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Hashable, Optional
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image/cache")
+IMAGE_CACHE_MAX_BYTES = int(
+    os.getenv("IMAGE_CACHE_MAX_BYTES", str(20 * 1024**3))
+)
+IMAGE_CACHE_RESCAN_INTERVAL = float(
+    os.getenv("IMAGE_CACHE_RESCAN_INTERVAL", "300")
+)
+IMAGE_CACHE_PART_MAX_AGE = float(
+    os.getenv("IMAGE_CACHE_PART_MAX_AGE", str(24 * 3600))
+)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ImageCache:
+    """On-disk LRU cache of remote image files keyed by bucket/key/ETag.
+
+    Each object lives at ``root/<sha256(bucket/key)>/<sha256(etag)><suffix>``
+    and the file mtime records the last access, so recency survives restarts.
+    The size of the cache is tracked as files are added and only rescanned
+    when it goes over budget or every rescan_interval seconds, to pick up
+    files written by other processes sharing the directory.
+    """
+
+    def __init__(
+        self,
+        root: str | Path = IMAGE_CACHE_DIR,
+        max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+        rescan_interval: float = IMAGE_CACHE_RESCAN_INTERVAL,
+        part_max_age: float = IMAGE_CACHE_PART_MAX_AGE,
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        self.part_max_age = part_max_age
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._total_bytes: int | None = None
+        self._scanned_at = float("-inf")
+
+    def get(
+        self, bucket: str, key: str, etag: Optional[str] = None
+    ) -> Path | None:
+        path = self._find(bucket, key, etag)
+        with self._lock:
+            if path is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+        os.utime(path)
+        return path
+
+    def put(
+        self,
+        bucket: str,
+        key: str,
+        etag: str,
+        write: Callable[[Path], None],
+    ) -> Path:
+        entry_dir = self._entry_dir(bucket, key)
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        target = self._entry_path(bucket, key, etag)
+
+        fd, tmp_name = tempfile.mkstemp(dir=entry_dir, suffix=".part")
+        os.close(fd)
+        try:
+            write(Path(tmp_name))
+            os.replace(tmp_name, target)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+        added = _size(target)
+        for stale in entry_dir.iterdir():
+            if stale != target and stale.suffix != ".part":
+                added -= _size(stale)
+                stale.unlink(missing_ok=True)
+
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += added
+            due = (
+                self._total_bytes is None
+                or self._total_bytes > self.max_bytes
+                or time.monotonic() - self._scanned_at > self.rescan_interval
+            )
+        if due:
+            self.evict(keep=target)
+        return target
+
+    def partial_path(self, bucket: str, key: str, etag: str) -> Path:
+        """Stable path for an interrupted download to resume into.
+
+        Like put's temporary files it ends in .part, so lookups and eviction
+        skip it until put's write callback moves it into place.
+        """
+        entry_dir = self._entry_dir(bucket, key)
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        return Path(entry_dir, _digest(etag) + ".part")
+
+    def evict(self, keep: Path | None = None) -> None:
+        """Scan the cache and drop least recently used files over budget.
+
+        Partial downloads count towards the budget but are only removed
+        once they are older than part_max_age, as a download may still be
+        writing or resuming them. One thread scans at a time.
+        """
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            self._evict(keep)
+        finally:
+            self._evict_lock.release()
+
+    def _evict(self, keep: Path | None) -> None:
+        now = time.time()
+        entries, total = [], 0
+        for path in self.root.glob("*/*"):
+            # Another process sharing the cache may have removed it.
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.suffix != ".part":
+                entries.append((stat.st_mtime, stat.st_size, path))
+            elif now - stat.st_mtime > self.part_max_age:
+                logging.info(f"Remove abandoned partial download {path}")
+                path.unlink(missing_ok=True)
+                continue
+            total += stat.st_size
+
+        evictions = 0
+        for _, size, path in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            logging.info(f"Evict cached image {path}")
+            path.unlink(missing_ok=True)
+            total -= size
+            evictions += 1
+
+        with self._lock:
+            self._total_bytes = total
+            self._scanned_at = time.monotonic()
+            self.stats.evictions += evictions
+
+    def _find(self, bucket, key, etag) -> Path | None:
+        if etag is not None:
+            path = self._entry_path(bucket, key, etag)
+            return path if path.exists() else None
+
+        entry_dir = self._entry_dir(bucket, key)
+        if not entry_dir.exists():
+            return None
+        candidates = [
+            path for path in entry_dir.iterdir() if path.suffix != ".part"
+        ]
+        return (
+            max(candidates, key=lambda p: p.stat().st_mtime)
+            if candidates
+            else None
+        )
+
+    def _entry_dir(self, bucket: str, key: str) -> Path:
+        return Path(self.root, _digest(f"{bucket}/{key}"))
+
+    def _entry_path(self, bucket: str, key: str, etag: str) -> Path:
+        suffix = Path(key).suffix
+        return Path(self._entry_dir(bucket, key), _digest(etag) + suffix)
+
+
+class InFlight:
+    """Runs one call per key at a time; callers arriving meanwhile share it.
+
+    Keeps concurrent sessions and worker threads from downloading the same
+    file twice.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: Hashable, call: Callable):
+        with self._lock:
+            future = self._calls.get(key)
+            owner = future is None
+            if owner:
+                future = self._calls[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            result = call()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+def _size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+_image_cache: ImageCache | None = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    global _image_cache
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache()
+        return _image_cache
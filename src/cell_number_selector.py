@@ -1,10 +1,10 @@
 import logging
-from sqlite3 import sqlite_version_info
 
 import streamlit as st
 
-from src.database import query_database
-from src.renderer import return_selectbox_result
+from src.lease import get_session_cells
+from src.query_cache import QueryScope, cached_query
+from src.renderer import return_selectbox_result, selectbox_index
 
 
 class CellNumberRenderer:
@@ -24,14 +24,27 @@ class CellNumberRenderer:
     def get_data_list(self):
         sql = f"""SELECT cell_number 
                 FROM {self.project_name}_cell 
-                WHERE cell_type = '{self.cell_type}' 
-                AND patient_id = {self.patient_id} 
+                WHERE cell_type = %s 
+                AND patient_id = %s 
                 ORDER BY cell_number"""
+        data_list = cached_query(
+            QueryScope(
+                self.project_name,
+                patient_id=self.patient_id,
+                cell_type=self.cell_type,
+            ),
+            sql,
+            (self.cell_type, self.patient_id),
+        )
 
-        return return_selectbox_result([data["cell_number"] for data in query_database(sql)])  # type: ignore
+        return return_selectbox_result([data["cell_number"] for data in data_list])  # type: ignore
 
-    def render(self):
-        return st.selectbox(self.name, self.data_list, index=0)
+    def render(self, value=None):
+        return st.selectbox(
+            self.name,
+            self.data_list,
+            index=selectbox_index(self.data_list, value),
+        )
 
 
 class FilterCellNumberRenderer(CellNumberRenderer):
@@ -39,48 +52,18 @@ class FilterCellNumberRenderer(CellNumberRenderer):
         self.label_type = label_type
         super().__init__(name, project_name, patient_id, cell_type)
 
-
-class FilterQualityCellNumberRenderer(FilterCellNumberRenderer):
-    def get_data_list(self):
-        sql = f"""SELECT distinct(cell_number) 
-                FROM {self.project_name}_cell 
-                WHERE cell_type = '{self.cell_type}' 
-                AND patient_id = {self.patient_id} 
-                AND cell_id IN 
-                    (SELECT distinct(cell_id) FROM {self.project_name}_image WHERE image_id NOT IN (SELECT image_id FROM {self.project_name}_image_{self.label_type})) 
-                ORDER BY cell_number"""
-
-        logging.debug(sql)
-        logging.debug([data["cell_number"] for data in query_database(sql)])
-
-        return return_selectbox_result(
-            [data["cell_number"] for data in query_database(sql)]
-        )
-
-
-class FilterCenterCellNumberRenderer(FilterCellNumberRenderer):
     def get_data_list(self):
-        sql = f"""SELECT distinct(cell_number) 
-                FROM {self.project_name}_cell 
-                WHERE cell_type = '{self.cell_type}' 
-                AND patient_id = {self.patient_id} 
-                AND cell_id IN 
-                    (SELECT distinct(cell_id) 
-                    FROM {self.project_name}_image 
-                    WHERE image_id NOT IN (SELECT image_id FROM {self.project_name}_image_{self.label_type})
-                    AND image_type = 'HOLOTOMOGRAPHY') 
-                ORDER BY cell_number"""
-        logging.debug(sql)
-        logging.debug([data["cell_number"] for data in query_database(sql)])
-        return return_selectbox_result(
-            [data["cell_number"] for data in query_database(sql)]
-        )
+        data_list = get_session_cells(
+            self.project_name, self.label_type
+        ).cell_numbers(self.patient_id, self.cell_type)
+        logging.debug(data_list)
+        return return_selectbox_result(data_list)
 
 
 class CellNumberRendererFactory:
     factory_dict = {
-        "quality": FilterQualityCellNumberRenderer,
-        "center": FilterCenterCellNumberRenderer,
+        "quality": FilterCellNumberRenderer,
+        "center": FilterCellNumberRenderer,
     }
 
     def get_renderer(
@@ -4,11 +4,47 @@ import streamlit as st
 
 from src.cell_number_selector import CellNumberRendererFactory
 from src.cell_type_selector import CellTypeRendererFactory
+from src.label_events import sync_label_revision
+from src.lease import get_session_cells
 from src.patient_id_selector import PatientListRendererFactory
 from src.project_selector import ProjectListRenderer
 from src.renderer import OptionRenderer
 
 
+def cell_selected(label_type) -> bool:
+    """False when a selector had nothing to offer.
+
+    The filtered selectors have no options once every cell is labelled or
+    leased to other sessions, and then leave None behind.
+    """
+    return not any(
+        value is None or value == "Not Available"
+        for value in (
+            st.session_state[f"{label_type}_patient_id"],
+            st.session_state[f"{label_type}_cell_type"],
+            st.session_state[f"{label_type}_cell_number"],
+        )
+    )
+
+
+def jump_to_next_unlabelled(label_type):
+    next_cell = get_session_cells(
+        st.session_state[f"{label_type}_project_name"], label_type
+    ).next_after(
+        st.session_state[f"{label_type}_patient_id"],
+        st.session_state[f"{label_type}_cell_type"],
+        st.session_state[f"{label_type}_cell_number"],
+    )
+    if next_cell is None:
+        return
+    logging.info(f"Jump to next unlabelled cell {next_cell}")
+    (
+        st.session_state[f"{label_type}_patient_id"],
+        st.session_state[f"{label_type}_cell_type"],
+        st.session_state[f"{label_type}_cell_number"],
+    ) = next_cell
+
+
 def render_cell_selector(label_type):
     logging.info("Render Sidebar Cell Selector")
     with st.sidebar:
@@ -26,6 +62,9 @@ def render_cell_selector(label_type):
         logging.info(
             f"Set tomocube project name to {st.session_state[f'{label_type}_project_name']}"
         )
+        sync_label_revision(
+            st.session_state[f"{label_type}_project_name"], label_type
+        )
         st.session_state[f"{label_type}_patient_id"] = (
             PatientListRendererFactory()
             .get_renderer(
@@ -34,7 +73,7 @@ def render_cell_selector(label_type):
                 st.session_state[f"{label_type}_filter_labeled"],
                 label_type,
             )
-            .render()
+            .render(st.session_state[f"{label_type}_patient_id"])
         )
         st.session_state[f"{label_type}_cell_type"] = (
             CellTypeRendererFactory()
@@ -45,17 +84,24 @@ def render_cell_selector(label_type):
                 st.session_state[f"{label_type}_filter_labeled"],
                 label_type,
             )
-            .render()
+            .render(st.session_state[f"{label_type}_cell_type"])
         )
-        st.session_state[f"{label_type}_cell_number"] = (
-            CellNumberRendererFactory()
-            .get_renderer(
-                "Cell Number",
-                st.session_state[f"{label_type}_project_name"],
-                st.session_state[f"{label_type}_patient_id"],
-                st.session_state[f"{label_type}_cell_type"],
-                st.session_state[f"{label_type}_filter_labeled"],
-                label_type,
-            )
-            .render()
+        cell_number_renderer = CellNumberRendererFactory().get_renderer(
+            "Cell Number",
+            st.session_state[f"{label_type}_project_name"],
+            st.session_state[f"{label_type}_patient_id"],
+            st.session_state[f"{label_type}_cell_type"],
+            st.session_state[f"{label_type}_filter_labeled"],
+            label_type,
+        )
+        st.session_state[
+            f"{label_type}_cell_number"
+        ] = cell_number_renderer.render(
+            st.session_state[f"{label_type}_cell_number"]
+        )
+
+        st.button(
+            "Next unlabelled",
+            on_click=jump_to_next_unlabelled,
+            args=(label_type,),
         )
@@ -1,7 +1,8 @@
 import streamlit as st
 
-from src.database import query_database
-from src.renderer import return_selectbox_result
+from src.lease import get_session_cells
+from src.query_cache import QueryScope, cached_query
+from src.renderer import return_selectbox_result, selectbox_index
 
 
 class CellTypeRenderer:
@@ -14,14 +15,23 @@ class CellTypeRenderer:
     def get_data_list(self):
         sql = f"""SELECT distinct(cell_type) 
                 FROM {self.project_name}_cell 
-                WHERE patient_id = {self.patient_id} 
+                WHERE patient_id = %s 
                 ORDER BY cell_type"""
+        data_list = cached_query(
+            QueryScope(self.project_name, patient_id=self.patient_id),
+            sql,
+            (self.patient_id,),
+        )
         return return_selectbox_result(
-            [data["cell_type"] for data in query_database(sql)]
+            [data["cell_type"] for data in data_list]
         )
 
-    def render(self):
-        return st.selectbox(self.name, self.data_list, index=0)
+    def render(self, value=None):
+        return st.selectbox(
+            self.name,
+            self.data_list,
+            index=selectbox_index(self.data_list, value),
+        )
 
 
 class FilterCellTypeRenderer(CellTypeRenderer):
@@ -31,40 +41,18 @@ class FilterCellTypeRenderer(CellTypeRenderer):
         self.label_type = label_type
         super().__init__(name, project_name, patient_id)
 
-
-class FilterQualityCellTypeRenderer(FilterCellTypeRenderer):
-    def get_celltype_list(self):
-        sql = f"""SELECT distinct(cell_type) 
-                FROM {self.project_name}_cell 
-                WHERE patient_id = {self.patient_id} 
-                AND cell_id IN 
-                    (SELECT distinct(cell_id) 
-                    FROM {self.project_name}_image 
-                    WHERE image_id NOT IN (SELECT image_id FROM {self.project_name}_image_{self.label_type}))
-                ORDER BY cell_type"""
-
-        return return_selectbox_result([data["cell_type"] for data in query_database(sql)])  # type: ignore
-
-
-class FilterCenterCellTypeRenderer(FilterCellTypeRenderer):
-    def get_celltype_list(self):
-        sql = f"""SELECT distinct(cell_type) 
-                FROM {self.project_name}_cell 
-                WHERE patient_id = {self.patient_id} 
-                AND cell_id IN 
-                    (SELECT distinct(cell_id) 
-                    FROM {self.project_name}_image 
-                    WHERE image_id NOT IN (SELECT image_id FROM {self.project_name}_image_{self.label_type})
-                    AND image_type = 'HOLOTOMOGRAPHY' )
-                ORDER BY cell_type"""
-
-        return return_selectbox_result([data["cell_type"] for data in query_database(sql)])  # type: ignore
+    def get_data_list(self):
+        return return_selectbox_result(
+            get_session_cells(self.project_name, self.label_type).cell_types(
+                self.patient_id
+            )
+        )
 
 
 class CellTypeRendererFactory:
     factory_dict = {
-        "quality": FilterQualityCellTypeRenderer,
-        "center": FilterCenterCellTypeRenderer,
+        "quality": FilterCellTypeRenderer,
+        "center": FilterCellTypeRenderer,
     }
 
     def get_renderer(
@@ -1,24 +1,33 @@
 import logging
+from typing import Callable, Optional
 
 import numpy as np
 import streamlit as st
+from PIL import Image
 from streamlit_custom_center_labeller.streamlit_custom_image_labeller import (
     st_custom_image_labeller,
 )
 
-from src.cell_selector import render_cell_selector
+from src.bulk_import import upsert_labels
+from src.cell_selector import cell_selected, render_cell_selector
 from src.database import Database
-from src.image import TomocubeImage, download_image, get_images
+from src.image import (
+    ImageType,
+    download_image,
+    get_images,
+    load_projections,
+)
+from src.image_source import get_image_source
+from src.label_events import labels_saved
+from src.lease import get_session_cells
+from src.metrics import span
 from src.point import Point, PointData
+from src.prefetch import Prefetcher
+from src.projection import projection_key
+from src.pyramid import PREVIEW_WIDTH, fit_width
 from src.renderer import LabelProgressRenderer, TitleRenderer
-from src.s3 import (
-    AWS_KEY,
-    AWS_PASSWORD,
-    S3Credential,
-    S3Downloader,
-    get_s3_bucket,
-)
 from src.session import set_session_state
+from src.slice_cache import get_slice_image
 
 
 def set_default_point(
@@ -33,19 +42,90 @@ def set_default_point(
     st.session_state["point"] = pointobj.point
 
 
-def render_morphology_all_axis(image: np.ndarray) -> None:
+MORPHOLOGY_PREVIEW_WIDTH = 256
+MORPHOLOGY_VIEWS = {
+    "Slices": None,
+    "Max projection": "max",
+    "Min projection": "min",
+    "Mean projection": "mean",
+}
+
+
+def get_ht_slice_image(
+    idx: int, axis: int, max_width: Optional[int] = None
+) -> Image.Image:
+    return get_slice_image(
+        (
+            st.session_state["center_project_name"],
+            st.session_state["ht_image_meta_center"].image_id,
+        ),
+        st.session_state["ht_image"],
+        idx,
+        axis,
+        max_width,
+    )
+
+
+def get_labeller_image(idx: int, axis: int) -> Image.Image:
+    return get_ht_slice_image(
+        idx, axis, st.session_state["center_labeller_width"]
+    )
+
+
+def labeller_scale(image: Image.Image, axis: int) -> int:
+    """Volume pixels per pixel of a labeller image along each side."""
+    shape = st.session_state["ht_image"].shape
+    full_width = shape[1] if axis == 2 else shape[2]
+    return max(1, round(full_width / image.width))
+
+
+def to_volume(value: int, scale: int) -> int:
+    # A preview pixel covers scale volume pixels; take the middle one.
+    return value * scale + scale // 2
+
+
+def render_morphology_all_axis(
+    image: np.ndarray,
+    projections_loader: Optional[Callable[[], dict]] = None,
+) -> None:
+    """Slices along every axis, or projections if a loader is given."""
     st.subheader("Morphology")
+    views = list(MORPHOLOGY_VIEWS)
+    view = (
+        st.radio("View", views, key="morphology_view")
+        if projections_loader is not None
+        else views[0]
+    )
+    max_width = (
+        None
+        if st.checkbox("Full resolution", value=False, key="morphology_full")
+        else MORPHOLOGY_PREVIEW_WIDTH
+    )
+
+    kind = MORPHOLOGY_VIEWS[view]
+    projections = None if kind is None else projections_loader()
+    for axis, col in enumerate(st.columns(3)):
+        with col:
+            if projections is None:
+                _render_each_axis(image, axis, max_width)
+            else:
+                _render_projection(
+                    projections[projection_key(kind, axis)], max_width
+                )
 
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        _render_each_axis(image, 0)
-    with col2:
-        _render_each_axis(image, 1)
-    with col3:
-        _render_each_axis(image, 2)
 
+def _render_projection(
+    projection: np.ndarray, max_width: Optional[int] = None
+) -> None:
+    if max_width is not None:
+        projection = fit_width(projection, max_width)
+    with span("render"):
+        st.image(projection, use_column_width=True, clamp=True)
 
-def _render_each_axis(image: np.ndarray, axis: int) -> None:
+
+def _render_each_axis(
+    image: np.ndarray, axis: int, max_width: Optional[int] = None
+) -> None:
     factory = {0: "z", 1: "x", 2: "y"}
     slider_value = st.slider(
         f"{factory[axis]}-axis",
@@ -54,11 +134,9 @@ def _render_each_axis(image: np.ndarray, axis: int) -> None:
         value=getattr(st.session_state.point, factory[axis]),
     )
 
-    st.image(
-        TomocubeImage.image_for_streamlit(image, idx=slider_value, axis=axis),
-        use_column_width=True,
-        clamp=True,
-    )
+    slice_image = get_ht_slice_image(slider_value, axis, max_width)
+    with span("render"):
+        st.image(slice_image, use_column_width=True, clamp=True)
 
 
 def save_point():
@@ -73,13 +151,9 @@ def save_point():
 
 
 def _write_to_database(project_name, image_id, x, y, z):
-    database = Database()
-    sql = f"""INSERT INTO {project_name}_image_center (image_id, x, y, z) 
-            VALUES ({image_id}, {x}, {y}, {z}) ON DUPLICATE KEY UPDATE x = {x}, y = {y}, z = {z}"""
-    database.execute_sql(sql)
-    database.conn.commit()
-    database.conn.close()
-    del database
+    with Database() as database:
+        upsert_labels(database, project_name, "center", [(image_id, x, y, z)])
+    labels_saved(project_name, "center", (image_id,))
 
 
 def app():
@@ -93,7 +167,13 @@ def app():
         f"{label_type}_cell_number",
         "ht_image",
         "ht_image_meta_center",
+        "center_prefetcher",
+        "center_labeller_width",
     )
+    if st.session_state["center_prefetcher"] is None:
+        st.session_state["center_prefetcher"] = Prefetcher(
+            (ImageType.HOLOTOMOGRAPHY,)
+        )
 
     if "output1" not in st.session_state:
         st.session_state["output1"] = {}
@@ -104,16 +184,17 @@ def app():
 
     render_cell_selector(label_type=label_type)  # type: ignore
 
-    credential = S3Credential(AWS_KEY, AWS_PASSWORD)
-    bucket = get_s3_bucket(
-        credential,
-        st.session_state[f"{label_type}_project_name"].replace("_", "-"),
+    project_name = st.session_state[f"{label_type}_project_name"]
+    downloader = get_image_source(project_name)
+
+    prefetcher = st.session_state["center_prefetcher"]
+    prefetcher.set_scope(
+        st.session_state[f"{label_type}_project_name"],
+        st.session_state[f"{label_type}_patient_id"],
+        st.session_state[f"{label_type}_cell_type"],
     )
-    downloader = S3Downloader(bucket)
 
-    if (st.session_state[f"{label_type}_cell_type"] == "Not Available") | (
-        st.session_state[f"{label_type}_cell_number"] == "Not Available"
-    ):
+    if not cell_selected(label_type):
         st.write("Not Available images")
         st.write(
             "Please uncheck filter out labeled or check the images really exist."
@@ -126,18 +207,33 @@ def app():
         st.session_state[f"{label_type}_cell_type"],
         st.session_state[f"{label_type}_cell_number"],
     )
+    prefetched = prefetcher.pop(st.session_state[f"{label_type}_cell_number"])
+
+    if ht_cellimage is None:
+        st.session_state["ht_image_meta_center"] = None
+        st.write("Not Available images")
+        st.write("This cell has no HT image.")
+        return
+
+    # The labeller views get a preview until the user asks for full
+    # resolution; clicks are scaled back to volume coordinates.
+    labeller_width = (
+        None
+        if st.checkbox("Full resolution", value=False, key="center_full")
+        else PREVIEW_WIDTH
+    )
+    resized = labeller_width != st.session_state["center_labeller_width"]
+    st.session_state["center_labeller_width"] = labeller_width
 
     if ht_cellimage != st.session_state["ht_image_meta_center"]:
-        if ht_cellimage is not None:
-            logging.info("Download image")
-            download_image(
-                downloader,
-                ht_cellimage.patient_name,
-                ht_cellimage.image_name,
-            )
-            st.session_state["ht_image_meta_center"] = ht_cellimage
-        else:
-            st.session_state["ht_image_meta_center"] = None
+        logging.info("Download image")
+        download_image(
+            downloader,
+            ht_cellimage.patient_name,
+            ht_cellimage.image_name,
+            prefetched,
+        )
+        st.session_state["ht_image_meta_center"] = ht_cellimage
 
         set_default_point(
             st.session_state[f"{label_type}_project_name"],
@@ -150,83 +246,80 @@ def app():
             f"ht_image_meta_center - {st.session_state['ht_image_meta_center']}"
         )
 
+        resized = True
+
+    if resized:
         logging.info("save xy_image")
-        st.session_state["xy_image"] = TomocubeImage.numpy_to_image(
-            TomocubeImage.slice_axis(
-                st.session_state["ht_image"],
-                idx=st.session_state["point"].z,
-                axis=0,
-            )
+        st.session_state["xy_image"] = get_labeller_image(
+            st.session_state["point"].z, axis=0
         )
 
-        logging.info("save zx_image")
-        st.session_state["zx_image"] = TomocubeImage.numpy_to_image(
-            TomocubeImage.slice_axis(
-                st.session_state["ht_image"],
-                idx=st.session_state["point"].y,
-                axis=2,
-            )
-        )
+        # ZX needs the whole volume, which may still be downloading; it is
+        # sliced after the XY column has been sent to the browser.
+        st.session_state["zx_image"] = None
+
+    prefetcher.schedule(
+        get_session_cells(project_name, label_type),
+        st.session_state[f"{label_type}_cell_number"],
+        lambda: get_image_source(project_name),
+    )
 
     col1, col2 = st.columns(2)
     with col1:
         logging.info("render col1")
         st.header("HT - XY")
-        output1 = st_custom_image_labeller(
-            st.session_state["xy_image"],
-            point=(
-                st.session_state["point"].y,
-                st.session_state["point"].x,
-            ),
-        )
+        scale = labeller_scale(st.session_state["xy_image"], axis=0)
+        with span("render"):
+            output1 = st_custom_image_labeller(
+                st.session_state["xy_image"],
+                point=(
+                    st.session_state["point"].y // scale,
+                    st.session_state["point"].x // scale,
+                ),
+            )
 
         if output1 != st.session_state["output1"]:
             logging.info("Save output1")
             st.session_state["output1"] = output1
-            logging.info(
-                f'Change Point to {PointData(output1["y"], output1["x"], st.session_state["point"].z)}'
-            )
             st.session_state["point"] = PointData(
-                output1["y"],
-                output1["x"],
+                to_volume(output1["y"], scale),
+                to_volume(output1["x"], scale),
                 st.session_state["point"].z,
             )
-            st.session_state["zx_image"] = TomocubeImage.numpy_to_image(
-                TomocubeImage.slice_axis(
-                    st.session_state["ht_image"],
-                    idx=st.session_state["point"].y,
-                    axis=2,
-                )
+            logging.info(f'Change Point to {st.session_state["point"]}')
+            st.session_state["zx_image"] = get_labeller_image(
+                st.session_state["point"].y, axis=2
             )
 
     with col2:
         logging.info("render col2")
         st.header("HT - ZX")
-        output2 = st_custom_image_labeller(
-            st.session_state["zx_image"],
-            point=(
-                st.session_state["point"].x,
-                st.session_state["point"].z,
-            ),
-        )
+        if st.session_state["zx_image"] is None:
+            logging.info("save zx_image")
+            st.session_state["zx_image"] = get_labeller_image(
+                st.session_state["point"].y, axis=2
+            )
+        scale = labeller_scale(st.session_state["zx_image"], axis=2)
+        with span("render"):
+            output2 = st_custom_image_labeller(
+                st.session_state["zx_image"],
+                point=(
+                    st.session_state["point"].x // scale,
+                    st.session_state["point"].z // scale,
+                ),
+            )
         if output2 != st.session_state["output2"]:
             logging.info("Save output2")
             st.session_state["output2"] = output2
-            logging.info(
-                f'Change Point to {PointData(st.session_state["point"].x, st.session_state["point"].y, output2["y"])}'
-            )
             st.session_state["point"] = PointData(
-                output2["x"],
+                to_volume(output2["x"], scale),
                 st.session_state["point"].y,
-                output2["y"],
+                to_volume(output2["y"], scale),
             )
+            logging.info(f'Change Point to {st.session_state["point"]}')
 
-            st.session_state["xy_image"] = TomocubeImage.numpy_to_image(
-                TomocubeImage.slice_axis(
-                    st.session_state["ht_image"],
-                    idx=st.session_state["point"].z,
-                    axis=0,
-                )
+            st.session_state["xy_image"] = get_labeller_image(
+                st.session_state["point"].z, axis=0
             )
             st.experimental_rerun()
 
@@ -245,7 +338,15 @@ def app():
     )
 
     if st.checkbox("Show all axis", value=False):
-        render_morphology_all_axis(st.session_state["ht_image"])
+        ht_image_meta = st.session_state["ht_image_meta_center"]
+        render_morphology_all_axis(
+            st.session_state["ht_image"],
+            lambda: load_projections(
+                downloader,
+                ht_image_meta.patient_name,
+                ht_image_meta.image_name,
+            ),
+        )
 
     with st.sidebar:
         LabelProgressRenderer(
@@ -0,0 +1,172 @@
+"""Chunked, compressed storage for normalized HT volumes.
+
+Layout of a file::
+
+    MAGIC | chunk 0 | chunk 1 | ... | header JSON | header offset (u64) | MAGIC
+
+The header holds the shape, chunk shape, codec, the byte range of every
+chunk in C order and free-form metadata (original min/max, image_id). A
+slice along any axis decompresses only the chunks it crosses.
+"""
+from __future__ import annotations
+
+import json
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from itertools import product
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib is used instead
+    zstandard = None
+
+MAGIC = b"TCHK"
+FOOTER = struct.Struct("<Q4s")
+CHUNK_SHAPE = (8, 64, 64)
+CHUNK_CACHE_SIZE = int(os.getenv("CHUNK_CACHE_SIZE", "512"))
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 1), zlib.decompress),
+    "zstd": (_zstd_compress, _zstd_decompress),
+}
+DEFAULT_CODEC = "zlib" if zstandard is None else "zstd"
+
+
+def write_chunked(
+    path: str | Path,
+    slabs: Iterable[np.ndarray],
+    shape: tuple[int, int, int],
+    chunks: tuple[int, int, int] = CHUNK_SHAPE,
+    metadata: Optional[dict] = None,
+    codec: str = DEFAULT_CODEC,
+) -> None:
+    """Write a uint8 volume given as z slabs of chunks[0] planes each.
+
+    Taking slabs instead of the whole array keeps memory at one slab.
+    """
+    compress = CODECS[codec][0]
+    ranges = []
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        for slab in slabs:
+            for y, x in product(
+                range(0, shape[1], chunks[1]), range(0, shape[2], chunks[2])
+            ):
+                chunk = np.ascontiguousarray(
+                    slab[:, y : y + chunks[1], x : x + chunks[2]],
+                    dtype=np.uint8,
+                )
+                data = compress(chunk.tobytes())
+                ranges.append((f.tell(), len(data)))
+                f.write(data)
+
+        header = {
+            "shape": list(shape),
+            "chunks": list(chunks),
+            "codec": codec,
+            "ranges": ranges,
+            "metadata": metadata or {},
+        }
+        header_offset = f.tell()
+        f.write(json.dumps(header).encode())
+        f.write(FOOTER.pack(header_offset, MAGIC))
+
+
+class ChunkedVolume:
+    """Read side of write_chunked, with the same slicing API as HTVolume."""
+
+    def __init__(self, path: str | Path, cache_size: int = CHUNK_CACHE_SIZE):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self._cache_size = cache_size
+
+        self._file.seek(-FOOTER.size, os.SEEK_END)
+        footer_offset = self._file.tell()
+        header_offset, magic = FOOTER.unpack(self._file.read(FOOTER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a chunked volume")
+        self._file.seek(header_offset)
+        header = json.loads(self._file.read(footer_offset - header_offset))
+
+        self.shape = tuple(header["shape"])
+        self.ndim = len(self.shape)
+        self.chunks = tuple(header["chunks"])
+        self.metadata = header["metadata"]
+        self._ranges = header["ranges"]
+        self._decompress = CODECS[header["codec"]][1]
+        self._grid = tuple(
+            -(-size // chunk) for size, chunk in zip(self.shape, self.chunks)
+        )
+
+    @property
+    def normalization(self) -> tuple:
+        return (self.metadata.get("vmin"), self.metadata.get("vmax"), None)
+
+    def take(self, indices: int, axis: int) -> np.ndarray:
+        out_shape = [s for i, s in enumerate(self.shape) if i != axis]
+        out = np.empty(out_shape, dtype=np.uint8)
+        fixed = indices // self.chunks[axis]
+        offset = indices - fixed * self.chunks[axis]
+
+        grids = [
+            [fixed] if i == axis else range(n)
+            for i, n in enumerate(self._grid)
+        ]
+        for position in product(*grids):
+            chunk = self._read_chunk(position)
+            plane = chunk.take(indices=offset, axis=axis)
+            target = tuple(
+                slice(p * c, p * c + s)
+                for i, (p, c, s) in enumerate(
+                    zip(position, self.chunks, chunk.shape)
+                )
+                if i != axis
+            )
+            out[target] = plane
+        return out
+
+    def close(self) -> None:
+        self._file.close()
+        self._cache.clear()
+
+    def _read_chunk(self, position: tuple[int, int, int]) -> np.ndarray:
+        with self._lock:
+            chunk = self._cache.get(position)
+            if chunk is not None:
+                self._cache.move_to_end(position)
+                return chunk
+            z, y, x = position
+            offset, size = self._ranges[
+                (z * self._grid[1] + y) * self._grid[2] + x
+            ]
+            self._file.seek(offset)
+            data = self._file.read(size)
+
+        shape = tuple(
+            min(c, s - p * c)
+            for p, c, s in zip(position, self.chunks, self.shape)
+        )
+        chunk = np.frombuffer(self._decompress(data), np.uint8).reshape(shape)
+        with self._lock:
+            self._cache[position] = chunk
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return chunk
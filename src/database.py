@@ -1,8 +1,17 @@
+from __future__ import annotations
+
+import logging
 import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
 
 import pymysql
 from dotenv import load_dotenv
 
+from src.metrics import timed
+
 load_dotenv()
 
 MYSQL_HOST = os.getenv("MYSQL_HOST")
@@ -12,10 +21,32 @@ MYSQL_USER = os.getenv("MYSQL_USER")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
 MYSQL_CHARSET = os.getenv("MYSQL_CHARSET")
 
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "8"))
+MYSQL_POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", "10"))
+MYSQL_POOL_PING_INTERVAL = float(os.getenv("MYSQL_POOL_PING_INTERVAL", "30"))
+
+
+@dataclass
+class PoolMetrics:
+    acquired: int = 0
+    created: int = 0
+    discarded: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    @property
+    def mean_wait(self) -> float:
+        return self.total_wait / self.acquired if self.acquired else 0.0
+
+
+class ConnectionPool:
+    """Thread-safe pool of warm pymysql connections shared by the process."""
 
-class Database:
     def __init__(
         self,
+        max_size: int = MYSQL_POOL_SIZE,
+        timeout: float = MYSQL_POOL_TIMEOUT,
+        ping_interval: float = MYSQL_POOL_PING_INTERVAL,
         host=MYSQL_HOST,
         port=MYSQL_PORT,
         db=MYSQL_DB,
@@ -23,29 +54,182 @@ class Database:
         password=MYSQL_PASSWORD,
         charset=MYSQL_CHARSET,
     ):
-        self.conn = self.create_connection(
-            host, port, db, user, password, charset
-        )
-        self.cursor = self.conn.cursor(pymysql.cursors.DictCursor)
-
-    def create_connection(self, host, port, db, user, password, charset):
-        return pymysql.connect(
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.connect_kwargs = dict(
             host=host,
             port=port,
             db=db,
             user=user,
             password=password,
             charset=charset,
+        )
+        self.metrics = PoolMetrics()
+        self._idle: list[tuple] = []
+        self._size = 0
+        self._lock = threading.Lock()
+        # Notified whenever a connection is returned or a slot frees up.
+        self._available = threading.Condition(self._lock)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def create_connection(self):
+        return pymysql.connect(
+            **self.connect_kwargs, autocommit=True
         )  # type: ignore
 
-    def execute_sql(self, sql: str):
-        self.cursor.execute(sql)
+    def acquire(self):
+        start = time.perf_counter()
+        conn = self._checkout()
+        wait = time.perf_counter() - start
+        with self._lock:
+            self.metrics.acquired += 1
+            self.metrics.total_wait += wait
+            self.metrics.max_wait = max(self.metrics.max_wait, wait)
+        return conn
+
+    def release(self, conn, failed: bool = False) -> None:
+        """Return conn to the pool; after a failed query roll it back first.
+
+        A connection that cannot roll back is closed instead, so the next
+        borrower never inherits an open transaction or a broken socket.
+        """
+        if failed and conn.open:
+            try:
+                conn.rollback()
+            except pymysql.Error:
+                self._discard(conn)
+                return
+        if not conn.open:
+            self._discard(conn)
+            return
+        with self._available:
+            self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn, last_used = self._wait_for_slot(deadline)
+            if conn is None:
+                return self._connect()
+            if self._is_alive(conn, last_used):
+                return conn
+            self._discard(conn)
+
+    def _wait_for_slot(self, deadline: float) -> tuple:
+        """An idle (conn, last_used), or (None, None) for a reserved slot."""
+        with self._available:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"No database connection available after {self.timeout}s"
+                    )
+                self._available.wait(remaining)
+
+    def _connect(self):
+        try:
+            conn = self.create_connection()
+        except Exception:
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            raise
+        with self._lock:
+            self.metrics.created += 1
+        return conn
+
+    def _is_alive(self, conn, last_used: float) -> bool:
+        if time.monotonic() - last_used < self.ping_interval:
+            return conn.open
+        try:
+            conn.ping(reconnect=False)
+        except pymysql.Error:
+            logging.info("Drop stale database connection")
+            return False
+        return True
+
+    def _discard(self, conn) -> None:
+        try:
+            conn.close()
+        except pymysql.Error:
+            pass
+        with self._available:
+            self._size -= 1
+            self.metrics.discarded += 1
+            self._available.notify()
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+class Database:
+    def __init__(self, pool: ConnectionPool | None = None):
+        self.pool = get_pool() if pool is None else pool
+        self.conn = self.pool.acquire()
+        self.cursor = self.conn.cursor(pymysql.cursors.DictCursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(failed=exc_type is not None)
+
+    def execute_sql(self, sql: str, args=None):
+        self.cursor.execute(sql, args)
         return self.cursor.fetchall()
 
+    def execute_many(self, sql: str, args_list) -> int:
+        """Run an INSERT for many rows; pymysql sends one multi-row VALUES."""
+        return self.cursor.executemany(sql, args_list)
+
+    @contextmanager
+    def transaction(self):
+        self.conn.begin()
+        try:
+            yield self
+        except BaseException:
+            self.conn.rollback()
+            raise
+        else:
+            self.conn.commit()
+
+    def close(self, failed: bool = False):
+        if self.cursor is None:
+            return
+        try:
+            self.cursor.close()
+        except pymysql.Error:
+            failed = True
+        self.cursor = None
+        self.pool.release(self.conn, failed)
+
 
-def query_database(sql):
-    database = Database()
-    data_list = database.execute_sql(sql)
-    database.conn.close()
-    del database
-    return data_list
+@timed("query_database")
+def query_database(sql, args=None):
+    with Database() as database:
+        return database.execute_sql(sql, args)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, Optional
+
+from src.image import CellImageMeta, load_image
+from src.metrics import run_in_context
+
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "6"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=FETCH_WORKERS, thread_name_prefix="fetch"
+)
+
+
+def fetch_images(
+    cell_images: list[CellImageMeta],
+    downloader_factory: Callable,
+    prefetched: Optional[dict] = None,
+    ht_image: Optional[CellImageMeta] = None,
+) -> Iterator[tuple[CellImageMeta, object]]:
+    """Load the images of a cell concurrently, yielding each when decoded.
+
+    Prefetched images are yielded first, the rest in completion order, so
+    a cell takes about as long as its slowest image. Jobs share the source
+    downloader_factory returns; every source is safe to use from several
+    threads. The cell's HT image, if given, lets a MIP be derived instead
+    of downloaded.
+    """
+    prefetched = prefetched or {}
+    ht_name = None if ht_image is None else ht_image.image_name
+    jobs = {
+        run_in_context(
+            _executor,
+            _load,
+            downloader_factory,
+            cell_image.patient_name,
+            cell_image.image_name,
+            ht_name,
+        ): cell_image
+        for cell_image in cell_images
+        if cell_image.image_name not in prefetched
+    }
+    for cell_image in cell_images:
+        if cell_image.image_name in prefetched:
+            yield cell_image, prefetched[cell_image.image_name]
+    for job in as_completed(jobs):
+        yield jobs[job], job.result()
+
+
+def _load(downloader_factory, patient_name, image_name, ht_name):
+    return load_image(downloader_factory(), patient_name, image_name, ht_name)
@@ -1,15 +1,27 @@
-import io
-import shutil
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import logging
+import os
+import threading
 from pathlib import Path
 
-from google.auth.transport.requests import Request
+import requests
+from google.auth.transport.requests import AuthorizedSession, Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
+
+from src.cache import ImageCache, InFlight, get_image_cache
 
 SCOPES = ["https://www.googleapis.com/auth/drive"]
+GDRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+GDRIVE_CACHE_BUCKET = "gdrive"
+GDRIVE_CHUNK_SIZE = int(os.getenv("GDRIVE_CHUNK_SIZE", str(8 * 1024**2)))
+GDRIVE_RETRIES = int(os.getenv("GDRIVE_RETRIES", "3"))
+
+_fetches = InFlight()
 
 
 class GDriveCredential:
@@ -56,20 +68,145 @@ class GDriveCredential:
 
 
 class GDriveDownloader:
-    def __init__(self, credentials: Credentials):
+    """Streams Drive files to disk in chunks, resuming from partial files.
+
+    A .part file keeps the bytes received so far, so an interrupted
+    transfer continues with a Range request instead of starting over.
+    """
+
+    def __init__(
+        self,
+        credentials: Credentials,
+        cache: ImageCache | None = None,
+        chunk_size: int = GDRIVE_CHUNK_SIZE,
+    ):
         self.credentials = credentials
         self.service = self.get_service()
+        self.cache = get_image_cache() if cache is None else cache
+        self.chunk_size = chunk_size
+        self._local = threading.local()
 
     def get_service(self):
         return build("drive", "v3", credentials=self.credentials)
 
-    def download(self, file_id, download_path, file_name):
-        request = self.service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-            fh.seek(0)
-            with open(Path(download_path, file_name), "wb") as f:
-                shutil.copyfileobj(fh, f)
+    def download(self, file_id, download_path, file_name) -> Path:
+        target = Path(download_path, file_name)
+        part = target.with_name(f"{target.name}.part")
+        self._stream(file_id, part, int(self.metadata(file_id)["size"]))
+        os.replace(part, target)
+        return target
+
+    def fetch(self, file_id, file_name) -> Path:
+        """Download through the image cache, keyed by the file's MD5."""
+        key = f"{file_id}/{file_name}"
+        metadata = self.metadata(file_id)
+        etag = metadata["md5Checksum"]
+        cached = self.cache.get(GDRIVE_CACHE_BUCKET, key, etag)
+        logging.info(
+            f"Image cache {'miss' if cached is None else 'hit'} - {key}"
+        )
+        if cached is not None:
+            return cached
+        return _fetches.run(
+            (key, etag),
+            lambda: self._fetch_locked(file_id, key, etag, metadata["size"]),
+        )
+
+    def _fetch_locked(self, file_id, key, etag, size) -> Path:
+        """Resume the .part file while holding a lock on it.
+
+        Threads of this process already share one call through _fetches;
+        the lock file keeps another process, such as prewarm.py, from
+        appending to the same .part at the same time.
+        """
+        part = self.cache.partial_path(GDRIVE_CACHE_BUCKET, key, etag)
+        with open(part.with_suffix(".lock.part"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # The process that held the lock may have finished the file.
+            cached = self.cache.get(GDRIVE_CACHE_BUCKET, key, etag)
+            if cached is not None:
+                return cached
+            self._stream(file_id, part, int(size))
+            if file_md5(part) != etag:
+                part.unlink()
+                raise IOError(f"Download of {file_id} does not match its MD5")
+            return self.cache.put(
+                GDRIVE_CACHE_BUCKET,
+                key,
+                etag,
+                lambda path: os.replace(part, path),
+            )
+
+    def list_files(self, query: str) -> list[dict]:
+        response = self._session().get(
+            GDRIVE_FILES_URL,
+            params={
+                "q": query,
+                "fields": "files(id,name)",
+                "supportsAllDrives": True,
+                "includeItemsFromAllDrives": True,
+            },
+        )
+        response.raise_for_status()
+        return response.json()["files"]
+
+    def metadata(self, file_id) -> dict:
+        response = self._session().get(
+            f"{GDRIVE_FILES_URL}/{file_id}",
+            params={"fields": "size,md5Checksum", "supportsAllDrives": True},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def _stream(self, file_id, part: Path, size: int) -> None:
+        """Fill part up to size bytes, resuming after failed requests."""
+        for attempt in range(GDRIVE_RETRIES + 1):
+            offset = part.stat().st_size if part.exists() else 0
+            if offset >= size:
+                break
+            try:
+                self._stream_from(file_id, part, offset)
+            except requests.RequestException:
+                if attempt == GDRIVE_RETRIES:
+                    raise
+                logging.warning(
+                    f"Download of {file_id} interrupted, resume from "
+                    f"{part.stat().st_size if part.exists() else 0}"
+                )
+        received = part.stat().st_size if part.exists() else 0
+        if received != size:
+            # A longer file cannot be resumed, so start over next time.
+            if received > size:
+                part.unlink()
+            raise IOError(
+                f"Download of {file_id} stopped at {received} of {size} bytes"
+            )
+
+    def _stream_from(self, file_id, part: Path, offset: int) -> None:
+        with self._session().get(
+            f"{GDRIVE_FILES_URL}/{file_id}",
+            params={"alt": "media", "supportsAllDrives": True},
+            headers={"Range": f"bytes={offset}-"},
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            # 200 instead of 206 means the range was ignored.
+            mode = "ab" if response.status_code == 206 else "wb"
+            with open(part, mode) as f:
+                for chunk in response.iter_content(self.chunk_size):
+                    f.write(chunk)
+
+    def _session(self) -> AuthorizedSession:
+        # requests sessions are not thread safe, so one per thread.
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = AuthorizedSession(self.credentials)
+        return session
+
+
+def file_md5(path: Path, chunk_size: int = GDRIVE_CHUNK_SIZE) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
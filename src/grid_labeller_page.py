@@ -0,0 +1,219 @@
+import logging
+import math
+import os
+
+import streamlit as st
+
+from src.image import CellImageMeta, ImageType
+from src.image_source import get_image_source
+from src.label_events import sync_label_revision
+from src.lease import get_patient_cells
+from src.patient_id_selector import (
+    PatientListRenderer,
+    QueuePatientListRenderer,
+)
+from src.project_selector import ProjectListRenderer
+from src.quality import save_quality
+from src.query_cache import QueryScope, cached_query
+from src.renderer import LabelProgressRenderer, OptionRenderer, TitleRenderer
+from src.session import set_session_state
+from src.thumbnail import load_thumbnails
+
+GRID_COLUMNS = int(os.getenv("GRID_COLUMNS", "6"))
+GRID_PAGE_SIZES = [24, 48, 96]
+QUALITY_CAPTIONS = {0: "Good", 1: "Bad", None: "Unlabelled"}
+
+
+def get_patient_images(
+    project_name: str, patient_id: int, image_type: ImageType
+) -> list[tuple[CellImageMeta, int]]:
+    """A patient's images of one type with the HT image of the same cell."""
+    data = cached_query(
+        QueryScope(project_name, "quality", False, patient_id),
+        f"""SELECT
+                i.image_id,
+                i.file_name,
+                c.cell_type,
+                c.cell_number,
+                c.cell_id,
+                p.google_drive_parent_name,
+                q.quality,
+                h.image_id AS ht_image_id
+            FROM (SELECT *
+                FROM {project_name}_cell
+                WHERE patient_id = %s) c
+            JOIN {project_name}_image i
+            ON i.cell_id = c.cell_id AND i.image_type = %s
+            LEFT JOIN {project_name}_image h
+            ON h.cell_id = c.cell_id AND h.image_type = 'HOLOTOMOGRAPHY'
+            LEFT JOIN {project_name}_image_quality q
+            ON i.image_id = q.image_id
+            LEFT JOIN {project_name}_patient p
+            ON c.patient_id = p.patient_id
+            ORDER BY c.cell_type, c.cell_number""",
+        (patient_id, image_type.name),
+    )
+    return [
+        (
+            CellImageMeta(
+                d.get("image_id"),
+                d.get("file_name"),
+                image_type.name,  # type: ignore
+                d.get("cell_type"),
+                d.get("cell_number"),
+                d.get("cell_id"),
+                patient_id,
+                d.get("google_drive_parent_name"),
+                d.get("quality", None),
+            ),
+            d.get("ht_image_id"),
+        )
+        for d in data
+    ]
+
+
+def leased_to_session(
+    project_name, patient_id, images, label_type, page_size
+) -> list:
+    """Drop unlabelled images of cells this session does not lease.
+
+    Batch labelling would otherwise label cells other sessions are
+    working on; labelled images stay for review. The grid leases a page
+    worth of the patient's cells at a time.
+    """
+    cells = get_patient_cells(project_name, label_type, patient_id, page_size)
+    leased = {
+        (cell_type, cell_number)
+        for cell_type in cells.cell_types(patient_id)
+        for cell_number in cells.cell_numbers(patient_id, cell_type)
+    }
+    return [
+        (cell_image, ht_image_id)
+        for cell_image, ht_image_id in images
+        if cell_image.quality is not None
+        or (cell_image.cell_type, cell_image.cell_number) in leased
+    ]
+
+
+def selection_key(image_id: int) -> str:
+    return f"grid_select_{image_id}"
+
+
+def set_selection(image_ids: list[int], selected: bool) -> None:
+    for image_id in image_ids:
+        st.session_state[selection_key(image_id)] = selected
+
+
+def save_selection(project_name, page_images, quality) -> None:
+    """Write the quality of every selected image in one transaction.
+
+    A MIP label also applies to the HT image of the cell, as on the
+    single cell page.
+    """
+    image_ids = []
+    for cell_image, ht_image_id in page_images:
+        if st.session_state.get(selection_key(cell_image.image_id)):
+            image_ids.append(cell_image.image_id)
+            if cell_image.image_type == ImageType.MIP.name and ht_image_id:
+                image_ids.append(ht_image_id)
+    if not image_ids:
+        return
+    logging.info(f"Save {quality} for {len(image_ids)} images")
+    save_quality(project_name, tuple(image_ids), quality)
+    set_selection([c.image_id for c, _ in page_images], False)
+
+
+def paginate(images: list, page_size: int) -> list:
+    page_count = max(1, math.ceil(len(images) / page_size))
+    page = st.number_input("Page", 1, page_count, 1)
+
+    start = (page - 1) * page_size
+    end = min(start + page_size, len(images))
+    st.caption(f"Images {start + 1 if end else 0}-{end} of {len(images)}")
+    return images[start:end]
+
+
+def render_grid(page_images, thumbnails) -> None:
+    for row in range(0, len(page_images), GRID_COLUMNS):
+        columns = st.columns(GRID_COLUMNS)
+        for column, (cell_image, _), thumbnail in zip(
+            columns,
+            page_images[row : row + GRID_COLUMNS],
+            thumbnails[row : row + GRID_COLUMNS],
+        ):
+            with column:
+                st.image(thumbnail, use_column_width=True, clamp=True)
+                st.checkbox(
+                    f"{cell_image.cell_type} {cell_image.cell_number} - "
+                    f"{QUALITY_CAPTIONS[cell_image.quality]}",
+                    key=selection_key(cell_image.image_id),
+                )
+
+
+def app():
+    label_type = "quality"
+    set_session_state("grid_filter_labeled", "grid_patient_id")
+    if st.session_state["grid_filter_labeled"] is None:
+        st.session_state["grid_filter_labeled"] = True
+
+    TitleRenderer("Tomocube Image Quality Grid").render()
+
+    with st.sidebar:
+        st.session_state["grid_filter_labeled"] = OptionRenderer(
+            "Filter labeled", st.session_state["grid_filter_labeled"]
+        ).render()
+        project_name = ProjectListRenderer("Tomocube project").render()
+        sync_label_revision(project_name, label_type)
+        # Patients come from the work queue rather than the single cell
+        # pages' lease; the grid leases its own cells below.
+        patient_renderer = (
+            QueuePatientListRenderer("Patient ID", project_name, label_type)
+            if st.session_state["grid_filter_labeled"]
+            else PatientListRenderer("Patient ID", project_name)
+        )
+        st.session_state["grid_patient_id"] = patient_renderer.render(
+            st.session_state["grid_patient_id"]
+        )
+        image_type = ImageType[
+            st.radio(
+                "Image type", [ImageType.MIP.name, ImageType.BRIGHT_FIELD.name]
+            )
+        ]
+        page_size = st.selectbox("Images per page", GRID_PAGE_SIZES)
+
+    patient_id = st.session_state["grid_patient_id"]
+    if patient_id is None or patient_id == "Not Available":
+        st.write("Not Available images")
+        return
+
+    images = leased_to_session(
+        project_name,
+        patient_id,
+        get_patient_images(project_name, patient_id, image_type),
+        label_type,
+        page_size,
+    )
+    if st.session_state["grid_filter_labeled"]:
+        images = [image for image in images if image[0].quality is None]
+    page_images = paginate(images, page_size)
+
+    thumbnails = load_thumbnails(
+        [cell_image for cell_image, _ in page_images],
+        lambda: get_image_source(project_name),
+    )
+    page_ids = [cell_image.image_id for cell_image, _ in page_images]
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.button("Select all", on_click=set_selection, args=(page_ids, True))
+    col2.button("Clear", on_click=set_selection, args=(page_ids, False))
+    for column, quality in zip((col3, col4), ("Good", "Bad")):
+        column.button(
+            f"Mark {quality}",
+            on_click=save_selection,
+            args=(project_name, page_images, quality),
+        )
+
+    render_grid(page_images, thumbnails)
+
+    with st.sidebar:
+        LabelProgressRenderer(project_name, label_type).render()
@@ -1,16 +1,32 @@
 from __future__ import annotations
 
+import os
 from dataclasses import dataclass
 from enum import Enum, auto
 from pathlib import Path
-from typing import Optional, Union
+from typing import BinaryIO, Optional, Union
 
 import numpy as np
 import streamlit as st
 import tifffile
 from PIL import Image
 
+from src.chunked import CHUNK_SHAPE, ChunkedVolume, write_chunked
 from src.database import query_database
+from src.metrics import span, timed
+from src.normalize import (
+    normalize_to_uint8,
+    percentile_range,
+    value_range,
+)
+from src.projection import PROJECTIONS_SUFFIX, project_volume, projection_key
+from src.pyramid import ImagePyramid
+from src.query_cache import QueryScope, cached_query
+
+
+PROCESSED_SUFFIX = ".processed.npy"
+CHUNKED_SUFFIX = ".chunked.tchk"
+DERIVE_MIP = os.getenv("DERIVE_MIP", "0") == "1"
 
 
 class ImageType(Enum):
@@ -47,13 +63,14 @@ class CellImageMeta:
                 FROM (
                     SELECT * 
                     from {project_name}_image 
-                    WHERE image_id = 1) i
+                    WHERE image_id = %s) i
                 LEFT JOIN {project_name}_cell c
                 ON c.cell_id = i.cell_id
                 lEFT JOIN {project_name}_image_quality q
                 ON i.image_id = q.image_id
                 LEFT JOIN {project_name}_patient p
-                ON i.patient_id = p.patient_id"""
+                ON i.patient_id = p.patient_id""",
+            (image_id,),
         )
         return CellImageMeta(
             image_id,
@@ -78,7 +95,8 @@ class CellImageMeta:
         if (cell_type is None) | (cell_number is None):
             return []
 
-        data = query_database(
+        data = cached_query(
+            QueryScope(project_name, "quality", True, patient_id, cell_type),
             f"""SELECT 
                     i.image_id, 
                     i.file_name, 
@@ -91,15 +109,16 @@ class CellImageMeta:
                     q.quality
                 FROM (SELECT *
                     FROM {project_name}_cell 
-                    WHERE cell_type = '{cell_type}'
-                    AND cell_number = {cell_number}
-                    AND patient_id = {patient_id}) c
+                    WHERE cell_type = %s
+                    AND cell_number = %s
+                    AND patient_id = %s) c
                 LEFT JOIN {project_name}_image i
                 ON i.cell_id = c.cell_id
                 LEFT JOIN {project_name}_image_quality q
                 ON i.image_id = q.image_id
                 LEFT JOIN {project_name}_patient p
-                ON i.patient_id = p.patient_id"""
+                ON i.patient_id = p.patient_id""",
+            (cell_type, cell_number, patient_id),
         )
         return [
             CellImageMeta(
@@ -118,20 +137,22 @@ class CellImageMeta:
 
 
 class TomocubeImage:
-    def __init__(self, image_path: Path):
+    def __init__(self, image_path: Union[Path, BinaryIO]):
         self.image_path = image_path
 
+    @timed("process")
     def process(self):
-        image_arr = self.read_image()
-        image_arr = self.normalize_img(image_arr)
-        return image_arr.astype(np.uint8)
+        return self.normalize_img(self.read_image())
 
     def read_image(self) -> np.ndarray:
-        return tifffile.imread(str(self.image_path))
+        return tifffile.imread(self.image_path)
 
     @staticmethod
-    def normalize_img(img: np.ndarray) -> np.ndarray:
-        return (img - np.min(img)) / (np.max(img) - np.min(img)) * 255
+    def normalize_img(
+        img: np.ndarray,
+        clip_percentiles: Optional[tuple[float, float]] = None,
+    ) -> np.ndarray:
+        return normalize_to_uint8(img, clip_percentiles=clip_percentiles)
 
     @staticmethod
     def numpy_to_image(img_arr: np.ndarray) -> Image.Image:
@@ -150,19 +171,101 @@ class TomocubeImage:
         )
 
     @staticmethod
+    @timed("render")
     def render(image, width):
         st.image(image, width=width)
 
+    @staticmethod
+    @timed("render")
+    def render_pyramid(
+        pyramid: ImagePyramid, width: int, full_resolution: bool = False
+    ):
+        if full_resolution:
+            st.image(pyramid.full)
+        else:
+            st.image(pyramid.level_for_width(width), width=width)
+
 
 class BFImage(TomocubeImage):
     def read_image(self) -> np.ndarray:
         return np.asarray(Image.open(self.image_path))
 
+    @timed("process")
     def process(self):
         image_arr = self.read_image()
         return image_arr.astype(np.uint8)
 
 
+def open_memmap(image_path) -> Optional[np.memmap]:
+    """The TIFF data as a read-only memmap, None if it cannot be mapped."""
+    if not isinstance(image_path, (str, Path)):
+        return None
+    try:
+        return tifffile.memmap(image_path, mode="r")
+    except ValueError:
+        return None
+
+
+class HTVolume:
+    """Holotomography stack that reads and normalizes planes on demand.
+
+    The TIFF is memory-mapped when its data is contiguous and uncompressed,
+    otherwise planes are decoded page by page. Only the volume min and max
+    are computed up front, so a plane costs one slice of memory.
+    """
+
+    def __init__(
+        self,
+        image_path: Union[Path, BinaryIO],
+        clip_percentiles: Optional[tuple[float, float]] = None,
+    ):
+        self.image_path = image_path
+        self.clip_percentiles = clip_percentiles
+        with span("process"):
+            self._tiff = tifffile.TiffFile(image_path)
+            self._memmap = open_memmap(image_path)
+            self.shape = tuple(self._tiff.series[0].shape)
+            self.ndim = len(self.shape)
+            self.vmin, self.vmax = self._value_range()
+
+    @property
+    def normalization(self) -> tuple:
+        return (self.vmin, self.vmax, self.clip_percentiles)
+
+    def take(self, indices: int, axis: int) -> np.ndarray:
+        return normalize_to_uint8(
+            self.read_plane(indices, axis), self.vmin, self.vmax
+        )
+
+    def close(self) -> None:
+        self._memmap = None
+        self._tiff.close()
+
+    def _read_page(self, z: int) -> np.ndarray:
+        if self._memmap is not None:
+            return self._memmap[z]
+        return self._tiff.asarray(key=z)
+
+    def read_plane(self, idx: int, axis: int) -> np.ndarray:
+        """A plane of raw, unnormalized values."""
+        if axis == 0:
+            return self._read_page(idx)
+        if self._memmap is not None:
+            return self._memmap.take(indices=idx, axis=axis)
+        return np.stack(
+            [
+                self._read_page(z).take(indices=idx, axis=axis - 1)
+                for z in range(self.shape[0])
+            ]
+        )
+
+    def _value_range(self) -> tuple[float, float]:
+        pages = (self._read_page(z) for z in range(self.shape[0]))
+        if self.clip_percentiles is None:
+            return value_range(pages)
+        return percentile_range(pages, *self.clip_percentiles)
+
+
 def find_cell_image_by_image_type(
     cell_images: list[CellImageMeta], image_type: ImageType
 ) -> Union[CellImageMeta, None]:
@@ -192,20 +295,208 @@ def get_images(
     return bf, mip, ht
 
 
-def download_image(downloader, patient_name, image_name):
-    downloader.download(patient_name, image_name)
-
+def get_image_state_key(image_name: str) -> str:
     if "brightfield" in image_name.lower():
-        image_path = Path("image", "bf.tiff")
-        st.session_state["bf_image"] = BFImage(image_path).process()
-
+        return "bf_image"
     elif "mip" in image_name.lower():
-        image_path = Path("image", "mip.tiff")
-        st.session_state["mip_image"] = TomocubeImage(image_path).process()
-
+        return "mip_image"
     elif "tomogram" in image_name.lower():
-        image_path = Path("image", "ht.tiff")
-        st.session_state["ht_image"] = TomocubeImage(image_path).process()
-
+        return "ht_image"
     else:
         raise ValueError("Invalid image name")
+
+
+@timed("load_image")
+def load_image(
+    downloader, patient_name, image_name, ht_name=None, background=False
+) -> np.ndarray:
+    """Load an image for display.
+
+    With ht_name given, a MIP is derived from that HT volume instead when
+    the volume is stored locally already. Background loads, for prefetch,
+    queue remote volume downloads behind the ones of the cell on screen.
+    """
+    state_key = get_image_state_key(image_name)
+    if state_key == "mip_image" and ht_name is not None and DERIVE_MIP:
+        mip = derive_mip(downloader, patient_name, image_name, ht_name)
+        if mip is not None:
+            return mip
+    if state_key == "ht_image":
+        remote_volume = getattr(downloader, "remote_volume", None)
+        volume = (
+            None
+            if remote_volume is None
+            else remote_volume(patient_name, image_name, background)
+        )
+        if volume is not None:
+            return volume
+
+    image_path = downloader.fetch(patient_name, image_name)
+    if state_key == "ht_image":
+        return load_volume(
+            downloader, f"{patient_name}/{image_name}", image_path
+        )
+    image_class = BFImage if state_key == "bf_image" else TomocubeImage
+    return load_processed(
+        downloader, f"{patient_name}/{image_name}", image_path, image_class
+    )
+
+
+def load_volume(downloader, key, image_path) -> Union[HTVolume, ChunkedVolume]:
+    """An HT volume, read from its chunked copy only when that is faster.
+
+    A plane of a memory-mapped TIFF is one strided read, while a chunked
+    plane decodes every chunk it crosses, so the chunked copy is used only
+    for TIFFs that cannot be mapped.
+    """
+    if isinstance(image_path, Path) and open_memmap(image_path) is None:
+        cached = downloader.cache.get(
+            downloader.name,
+            f"{key}{CHUNKED_SUFFIX}",
+            downloader.version(image_path),
+        )
+        if cached is not None:
+            return ChunkedVolume(cached)
+    return HTVolume(image_path)
+
+
+def build_chunked_volume(
+    downloader, patient_name, image_name, image_id=None
+) -> Path:
+    """Normalize an HT volume once and store it in the chunked format."""
+    key = f"{patient_name}/{image_name}"
+    image_path = downloader.download(patient_name, image_name)
+    version = downloader.version(image_path)
+    cached = downloader.cache.get(
+        downloader.name, f"{key}{CHUNKED_SUFFIX}", version
+    )
+    if cached is not None:
+        return cached
+    volume = HTVolume(image_path)
+    depth = CHUNK_SHAPE[0]
+    slabs = (
+        np.stack(
+            [
+                volume.take(z, 0)
+                for z in range(z0, min(z0 + depth, volume.shape[0]))
+            ]
+        )
+        for z0 in range(0, volume.shape[0], depth)
+    )
+    metadata = {
+        "image_id": image_id,
+        "key": key,
+        "vmin": float(volume.vmin),
+        "vmax": float(volume.vmax),
+    }
+    try:
+        return downloader.cache.put(
+            downloader.name,
+            f"{key}{CHUNKED_SUFFIX}",
+            version,
+            lambda path: write_chunked(
+                path, slabs, volume.shape, metadata=metadata
+            ),
+        )
+    finally:
+        volume.close()
+
+
+def load_projections(
+    downloader, patient_name, image_name, image_path=None
+) -> dict[str, np.ndarray]:
+    """Projections of the raw values of an HT volume, cached next to it."""
+    key = f"{patient_name}/{image_name}"
+    if image_path is None:
+        image_path = downloader.download(patient_name, image_name)
+    cache, source = downloader.cache, downloader.name
+    version = downloader.version(image_path)
+    projections_key = f"{key}{PROJECTIONS_SUFFIX}"
+    cached = cache.get(source, projections_key, version)
+    if cached is not None:
+        with np.load(cached) as data:
+            return dict(data)
+
+    volume = HTVolume(image_path)
+    try:
+        with span("projection"):
+            projections = project_volume(volume)
+    finally:
+        volume.close()
+
+    def write(path: Path) -> None:
+        with open(path, "wb") as f:
+            np.savez(f, **projections)
+
+    cache.put(source, projections_key, version, write)
+    return projections
+
+
+def derive_mip(
+    downloader, patient_name, mip_name, ht_name
+) -> Optional[np.ndarray]:
+    """The z projection of an HT volume in place of a MIP to download.
+
+    None when the MIP file is stored locally already, or the HT volume is
+    not.
+    """
+    if downloader.cached(patient_name, mip_name) is not None:
+        return None
+    image_path = downloader.cached(patient_name, ht_name)
+    if image_path is None:
+        return None
+    projections = load_projections(
+        downloader, patient_name, ht_name, image_path
+    )
+    return projections[projection_key("max", 0)]
+
+
+def load_processed(downloader, key, image_path, image_class) -> np.ndarray:
+    """Decode and normalize an image, caching the result next to the file.
+
+    The processed entry is keyed by the source's version of the file, so a
+    changed image is processed again.
+    """
+    if not isinstance(image_path, Path):
+        return image_class(image_path).process()
+
+    cache, source = downloader.cache, downloader.name
+    version = downloader.version(image_path)
+    processed_key = f"{key}{PROCESSED_SUFFIX}"
+    cached = cache.get(source, processed_key, version)
+    if cached is not None:
+        return np.load(cached)
+
+    image = image_class(image_path).process()
+
+    def write(path: Path) -> None:
+        with open(path, "wb") as f:
+            np.save(f, image)
+
+    cache.put(source, processed_key, version, write)
+    return image
+
+
+@timed("download_image")
+def download_image(downloader, patient_name, image_name, prefetched=None):
+    image = None if prefetched is None else prefetched.get(image_name)
+    if image is None:
+        image = load_image(downloader, patient_name, image_name)
+    store_image(image_name, image)
+
+
+def store_image(image_name, image) -> None:
+    """Put image in the session, closing the HT volume it replaces.
+
+    A volume holds a TIFF handle or memmap, and a remote one may still be
+    downloading, so the old one must not wait for garbage collection.
+    """
+    state_key = get_image_state_key(image_name)
+    previous = st.session_state.get(state_key)
+    if previous is not None and previous is not image:
+        close = getattr(previous, "close", None)
+        if close is not None:
+            close()
+    st.session_state[state_key] = image
+    if state_key != "ht_image":
+        st.session_state[f"{state_key}_pyramid"] = ImagePyramid(image)
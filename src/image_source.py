@@ -0,0 +1,183 @@
+"""Where a project's images come from.
+
+Every source has the downloader interface load_image uses: fetch and
+download return a local path (or, for S3 in memory mode, a buffer), and
+name/cache/version key the processed copies in the image cache. Projects
+pick a source in IMAGE_SOURCES_FILE, a JSON object such as::
+
+    {
+        "2022_tomocube_sepsis": {"type": "local", "root": "/data/sepsis"},
+        "2022_tomocube_igra": {"type": "s3", "bucket": "2022-tomocube-igra"},
+        "2022_tomocube_tb": {"type": "gdrive", "folder_id": "1AbC..."}
+    }
+
+Projects that are not listed read from the S3 bucket named after them.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import BinaryIO, Optional, Protocol, Union
+
+from dotenv import load_dotenv
+
+from src.cache import ImageCache, get_image_cache
+from src.gdrive import GDRIVE_CACHE_BUCKET, GDriveCredential, GDriveDownloader
+from src.s3 import (
+    AWS_KEY,
+    AWS_PASSWORD,
+    S3Credential,
+    S3Downloader,
+    get_s3_bucket,
+)
+
+load_dotenv()
+IMAGE_SOURCES_FILE = os.getenv("IMAGE_SOURCES_FILE", "image_sources.json")
+
+
+class ImageSource(Protocol):
+    name: str
+    cache: ImageCache
+
+    def fetch(
+        self, patient_name: str, image_name: str
+    ) -> Union[Path, BinaryIO]:
+        ...
+
+    def download(self, patient_name: str, image_name: str) -> Path:
+        ...
+
+    def version(self, path: Path) -> str:
+        """Changes whenever the file behind path changes."""
+        ...
+
+    def cached(self, patient_name: str, image_name: str) -> Optional[Path]:
+        """The local file if it is there without a download, else None."""
+        ...
+
+
+class LocalImageSource:
+    """Images read in place from a root/<patient>/<image> directory tree.
+
+    Nothing is copied: HT volumes are memory-mapped straight from the
+    microscope's disk or an NFS mount.
+    """
+
+    def __init__(
+        self, root: Union[str, Path], cache: ImageCache | None = None
+    ):
+        self.root = Path(root)
+        self.name = f"local:{self.root.resolve()}"
+        self.cache = get_image_cache() if cache is None else cache
+
+    def fetch(self, patient_name: str, image_name: str) -> Path:
+        return self.download(patient_name, image_name)
+
+    def download(self, patient_name: str, image_name: str) -> Path:
+        path = Path(self.root, patient_name, image_name)
+        if not path.exists():
+            raise FileNotFoundError(path)
+        return path
+
+    def version(self, path: Path) -> str:
+        stat = path.stat()
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    def cached(self, patient_name: str, image_name: str) -> Optional[Path]:
+        path = Path(self.root, patient_name, image_name)
+        return path if path.exists() else None
+
+
+class GDriveImageSource:
+    """Images in a Drive folder with one sub folder per patient."""
+
+    def __init__(self, folder_id: str, downloader: GDriveDownloader):
+        self.folder_id = folder_id
+        self.downloader = downloader
+        self.name = GDRIVE_CACHE_BUCKET
+        self.cache = downloader.cache
+        self._file_ids: dict[tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, patient_name: str, image_name: str) -> Path:
+        return self.download(patient_name, image_name)
+
+    def download(self, patient_name: str, image_name: str) -> Path:
+        return self.downloader.fetch(
+            self._file_id(patient_name, image_name), image_name
+        )
+
+    def version(self, path: Path) -> str:
+        return path.stem
+
+    def cached(self, patient_name: str, image_name: str) -> Optional[Path]:
+        # Cached copies are keyed by the Drive checksum, which takes an API
+        # call to look up.
+        return None
+
+    def _file_id(self, patient_name: str, image_name: str) -> str:
+        key = (patient_name, image_name)
+        with self._lock:
+            if key in self._file_ids:
+                return self._file_ids[key]
+        folder_id = self._find(patient_name, self.folder_id)
+        file_id = self._find(image_name, folder_id)
+        with self._lock:
+            self._file_ids[key] = file_id
+        return file_id
+
+    def _find(self, name: str, parent_id: str) -> str:
+        escaped = name.replace("\\", "\\\\").replace("'", "\\'")
+        files = self.downloader.list_files(
+            f"name = '{escaped}' and '{parent_id}' in parents "
+            "and trashed = false"
+        )
+        if not files:
+            raise FileNotFoundError(f"{name} in Drive folder {parent_id}")
+        return files[0]["id"]
+
+
+def load_source_config(path: Union[str, Path] = IMAGE_SOURCES_FILE) -> dict:
+    if not Path(path).exists():
+        return {}
+    return json.loads(Path(path).read_text())
+
+
+_sources: dict[str, ImageSource] = {}
+_sources_lock = threading.Lock()
+
+
+def get_image_source(project_name: str) -> ImageSource:
+    """The project's source, shared by every thread of the process.
+
+    Sources are created under the lock, so the Drive sign-in runs once and
+    token.json is never written by two threads at a time.
+    """
+    with _sources_lock:
+        source = _sources.get(project_name)
+        if source is None:
+            source = _sources[project_name] = create_image_source(project_name)
+        return source
+
+
+def create_image_source(
+    project_name: str, config: Optional[dict] = None
+) -> ImageSource:
+    config = load_source_config() if config is None else config
+    source = config.get(project_name, {"type": "s3"})
+    source_type = source["type"]
+
+    if source_type == "local":
+        return LocalImageSource(source["root"])
+    if source_type == "gdrive":
+        credentials = GDriveCredential().credentials
+        return GDriveImageSource(
+            source["folder_id"], GDriveDownloader(credentials)
+        )
+    if source_type == "s3":
+        credential = S3Credential(AWS_KEY, AWS_PASSWORD)
+        bucket_name = source.get("bucket", project_name.replace("_", "-"))
+        return S3Downloader(get_s3_bucket(credential, bucket_name))
+    raise ValueError(f"Unknown image source type {source_type}")
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import logging
+
+from src.database import query_database
+from src.label_revision import revision_changed
+from src.lease import release_labelled
+from src.overview import expire_overview_table, mark_overview_dirty
+from src.progress import expire_progress_counter, record_labels
+from src.query_cache import get_query_cache
+from src.work_queue import expire_work_queue, mark_labelled
+
+
+def get_labelled_cells(project_name, image_ids) -> list[dict]:
+    """cell_id, patient_id and cell_type of the cells the images belong to."""
+    if not image_ids:
+        return []
+    placeholders = ", ".join(["%s"] * len(image_ids))
+    return query_database(
+        f"""SELECT DISTINCT c.cell_id, c.patient_id, c.cell_type
+            FROM {project_name}_image i
+            JOIN {project_name}_cell c
+            ON i.cell_id = c.cell_id
+            WHERE i.image_id IN ({placeholders})""",
+        tuple(image_ids),
+    )
+
+
+def labels_saved(project_name, label_type, image_ids) -> None:
+    """Update in-memory indexes and drop cached results of the new labels."""
+    mark_labelled(project_name, label_type, image_ids)
+
+    cells = get_labelled_cells(project_name, image_ids)
+    cell_ids = [c["cell_id"] for c in cells]
+    record_labels(project_name, label_type, cell_ids)
+    release_labelled(project_name, label_type, cell_ids)
+
+    groups = {(c["patient_id"], c["cell_type"]) for c in cells}
+    query_cache = get_query_cache()
+    for patient_id, cell_type in groups:
+        query_cache.invalidate(project_name, label_type, patient_id, cell_type)
+    if label_type == "quality":
+        mark_overview_dirty(project_name, groups)
+
+
+def sync_label_revision(project_name, label_type) -> None:
+    """Drop in-memory label indexes when another process wrote labels."""
+    if not revision_changed(project_name, label_type):
+        return
+    logging.info(f"{label_type} labels of {project_name} changed elsewhere")
+    expire_work_queue(project_name, label_type)
+    expire_progress_counter(project_name, label_type)
+    get_query_cache().invalidate_label_type(project_name, label_type)
+    if label_type == "quality":
+        expire_overview_table(project_name)
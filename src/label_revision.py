@@ -0,0 +1,92 @@
+"""Label revisions shared between processes.
+
+In-memory indexes of labels (work queues, progress counters, cached
+queries, the overview) are kept current by labels_saved, which only
+reaches the process that calls it. Other processes, such as a bulk import
+from the command line, bump the label type's revision in
+{project}_label_revision and the Streamlit server polls it.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+from src.database import query_database
+
+LABEL_REVISION_POLL_INTERVAL = float(
+    os.getenv("LABEL_REVISION_POLL_INTERVAL", "30")
+)
+
+
+def revision_table_sql(project_name: str) -> str:
+    return f"""CREATE TABLE IF NOT EXISTS {project_name}_label_revision (
+            label_type VARCHAR(16) NOT NULL PRIMARY KEY,
+            revision INT NOT NULL
+        )"""
+
+
+_revision_tables: set[str] = set()
+_revision_tables_lock = threading.Lock()
+
+
+def ensure_revision_table(project_name: str) -> None:
+    with _revision_tables_lock:
+        if project_name not in _revision_tables:
+            query_database(revision_table_sql(project_name))
+            _revision_tables.add(project_name)
+
+
+def bump_revision(project_name: str, label_type: str) -> None:
+    ensure_revision_table(project_name)
+    query_database(
+        f"""INSERT INTO {project_name}_label_revision (label_type, revision)
+            VALUES (%s, 1)
+            ON DUPLICATE KEY UPDATE revision = revision + 1""",
+        (label_type,),
+    )
+
+
+def read_revision(project_name: str, label_type: str) -> int:
+    ensure_revision_table(project_name)
+    data = query_database(
+        f"""SELECT revision FROM {project_name}_label_revision
+            WHERE label_type = %s""",
+        (label_type,),
+    )
+    return data[0]["revision"] if data else 0
+
+
+class RevisionWatcher:
+    """Polls revisions at most once per interval and reports changes."""
+
+    def __init__(self, interval: float = LABEL_REVISION_POLL_INTERVAL):
+        self.interval = interval
+        self._seen: dict[tuple[str, str], int] = {}
+        self._checked_at: dict[tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def changed(self, project_name: str, label_type: str) -> bool:
+        """Whether the revision moved since the last poll.
+
+        The first poll of a label type only records its revision.
+        """
+        key = (project_name, label_type)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at.get(key, float("-inf")) < self.interval:
+                return False
+            self._checked_at[key] = now
+
+        revision = read_revision(project_name, label_type)
+        with self._lock:
+            previous = self._seen.get(key)
+            self._seen[key] = revision
+        return previous is not None and previous != revision
+
+
+_watcher = RevisionWatcher()
+
+
+def revision_changed(project_name: str, label_type: str) -> bool:
+    return _watcher.changed(project_name, label_type)
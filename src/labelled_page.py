@@ -1,46 +1,69 @@
-import numpy as np
+import math
+
 import pandas as pd
 import streamlit as st
 
-from src.database import query_database
+from src.label_events import sync_label_revision
+from src.overview import get_overview_table
 from src.project_selector import get_project_list
 from src.renderer import TitleRenderer
 
+OVERVIEW_PAGE_SIZES = [25, 50, 100, 200]
+
+
+def create_cell_metadata_table(project_name) -> pd.DataFrame:
+    return get_overview_table(project_name).to_frame()
+
+
+def filter_overview(data: pd.DataFrame) -> pd.DataFrame:
+    patient_ids = data.index.get_level_values("patient_id").unique()
+    cell_types = data.index.get_level_values("cell_type").unique()
 
-def create_cell_metadata_table(project_name):
-    sql = f"""
-    SELECT t.project_id, t.patient_id, t.cell_type, t.image_type, quality, COUNT(t.image_type) num_image
-    FROM 
-        (SELECT p.project_id, c.patient_id, c.cell_type, i.image_type, q.quality
-        FROM {project_name}_image i 
-        LEFT JOIN {project_name}_patient p
-        ON p.patient_id = i.patient_id
-        LEFT JOIN {project_name}_cell c 
-        ON i.cell_id = c.cell_id
-        LEFT JOIN {project_name}_image_quality q
-        ON i.image_id = q.image_id) t
-    GROUP BY t.project_id, t.patient_id, t.cell_type, t.image_type, t.quality
-    """
-    data = pd.DataFrame(query_database(sql))
-    data["quality"] = data["quality"].replace(
-        {0: "Good", 1: "Bad", np.nan: "Unlabelled"}
-    )
-    data = data[data.image_type != "MIP"]
-    data = data.pivot(
-        index=["project_id", "patient_id", "cell_type"],
-        columns=["image_type", "quality"],
-        values="num_image",
-    )
-    data = data.fillna(0)
-    data = data.astype(int)
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        selected_patients = st.multiselect("Patient", sorted(patient_ids))
+    with col2:
+        selected_cell_types = st.multiselect("Cell type", sorted(cell_types))
+    with col3:
+        only_unlabelled = st.checkbox("Only unlabelled")
+
+    if selected_patients:
+        data = data[
+            data.index.get_level_values("patient_id").isin(selected_patients)
+        ]
+    if selected_cell_types:
+        data = data[
+            data.index.get_level_values("cell_type").isin(selected_cell_types)
+        ]
+    if only_unlabelled:
+        unlabelled = [c for c in data.columns if c[1] == "Unlabelled"]
+        data = data[(data[unlabelled] > 0).any(axis=1)]
     return data
 
 
+def paginate(data: pd.DataFrame) -> pd.DataFrame:
+    col1, col2 = st.columns(2)
+    with col1:
+        page_size = st.selectbox("Rows per page", OVERVIEW_PAGE_SIZES)
+    page_count = max(1, math.ceil(len(data) / page_size))
+    with col2:
+        page = st.number_input("Page", 1, page_count, 1)
+
+    start = (page - 1) * page_size
+    end = min(start + page_size, len(data))
+    st.caption(f"Rows {start + 1 if end else 0}-{end} of {len(data)}")
+    return data.iloc[start:end]
+
+
 def app():
     TitleRenderer("Labelled Data Overview").render()
     project_list = get_project_list()
     project_name = st.selectbox("Select Project", project_list)
-    st.table(create_cell_metadata_table(f"{project_name}"))
+    sync_label_revision(project_name, "quality")
+    if st.button("Refresh overview"):
+        get_overview_table(project_name).rebuild()
+    data = filter_overview(create_cell_metadata_table(f"{project_name}"))
+    st.table(paginate(data))
 
 
 if __name__ == "__main__":
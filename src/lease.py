@@ -0,0 +1,254 @@
+"""Leases that keep concurrent labellers on distinct cells.
+
+Every session holds a batch of up to LEASE_BATCH_SIZE unlabelled cells in
+{project}_cell_lease and the filtered selectors only offer it those cells.
+A lease ends when its cell is labelled, when the session moves to another
+project, or LEASE_TTL seconds after the session stopped renewing it.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import uuid
+
+import streamlit as st
+
+from src.database import Database, query_database
+from src.work_queue import (
+    CellIndex,
+    WorkQueue,
+    get_work_queue,
+    peek_work_queue,
+)
+
+LEASE_BATCH_SIZE = int(os.getenv("LEASE_BATCH_SIZE", "20"))
+LEASE_TTL = int(os.getenv("LEASE_TTL", "900"))
+LEASE_RETRY_INTERVAL = float(os.getenv("LEASE_RETRY_INTERVAL", "5"))
+
+
+def lease_table_sql(project_name: str) -> str:
+    return f"""CREATE TABLE IF NOT EXISTS {project_name}_cell_lease (
+            cell_id INT NOT NULL,
+            label_type VARCHAR(16) NOT NULL,
+            session_id CHAR(32) NOT NULL,
+            expires_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (cell_id, label_type),
+            KEY session (session_id, label_type)
+        )"""
+
+
+_lease_tables: set[str] = set()
+_lease_tables_lock = threading.Lock()
+
+
+def ensure_lease_table(project_name: str) -> None:
+    with _lease_tables_lock:
+        if project_name not in _lease_tables:
+            query_database(lease_table_sql(project_name))
+            _lease_tables.add(project_name)
+
+
+def has_lease_table(project_name: str) -> bool:
+    """Whether this process leased cells of the project.
+
+    Only acquire_leases creates the table, so label writes never run DDL;
+    a process that never leased has no leases of its own to release, and
+    other processes' leases of labelled cells end by expiry.
+    """
+    with _lease_tables_lock:
+        return project_name in _lease_tables
+
+
+def acquire_leases(
+    project_name: str,
+    label_type: str,
+    session_id: str,
+    work_queue: WorkQueue,
+    batch_size: int = LEASE_BATCH_SIZE,
+    ttl: int = LEASE_TTL,
+    patient_id=None,
+) -> list[int]:
+    """Renew the session's leases and top them up to batch_size cells.
+
+    New cells are the first ones of the work queue that nobody else holds,
+    of one patient if patient_id is given.
+    The primary key makes INSERT IGNORE drop a cell that another session
+    leased in the meantime, so the cells returned are the ones held.
+    Expiry uses the database clock.
+    """
+    ensure_lease_table(project_name)
+    table = f"{project_name}_cell_lease"
+    with Database() as database, database.transaction():
+        database.execute_sql(
+            f"DELETE FROM {table} WHERE label_type = %s AND expires_at < NOW()",
+            (label_type,),
+        )
+        leases = database.execute_sql(
+            f"SELECT cell_id, session_id FROM {table} WHERE label_type = %s",
+            (label_type,),
+        )
+        mine = {
+            lease["cell_id"]
+            for lease in leases
+            if lease["session_id"] == session_id
+        }
+        taken = {lease["cell_id"] for lease in leases}
+        pending = {c for c in mine if work_queue.cell_key(c) is not None}
+
+        new = work_queue.take(
+            max(0, batch_size - len(pending)), taken, patient_id
+        )
+        if new:
+            database.execute_many(
+                f"""INSERT IGNORE INTO {table}
+                    (cell_id, label_type, session_id)
+                    VALUES (%s, %s, %s)""",
+                [(cell_id, label_type, session_id) for cell_id in new],
+            )
+        database.execute_sql(
+            f"""UPDATE {table}
+                SET expires_at = NOW() + INTERVAL %s SECOND
+                WHERE label_type = %s AND session_id = %s""",
+            (ttl, label_type, session_id),
+        )
+        rows = database.execute_sql(
+            f"""SELECT cell_id FROM {table}
+                WHERE label_type = %s AND session_id = %s""",
+            (label_type, session_id),
+        )
+    return [row["cell_id"] for row in rows]
+
+
+def release_cells(project_name: str, label_type: str, cell_ids) -> None:
+    if not cell_ids or not has_lease_table(project_name):
+        return
+    placeholders = ", ".join(["%s"] * len(cell_ids))
+    query_database(
+        f"""DELETE FROM {project_name}_cell_lease
+            WHERE label_type = %s AND cell_id IN ({placeholders})""",
+        (label_type, *cell_ids),
+    )
+
+
+def release_session(project_name: str, label_type: str, session_id) -> None:
+    if not has_lease_table(project_name):
+        return
+    query_database(
+        f"""DELETE FROM {project_name}_cell_lease
+            WHERE label_type = %s AND session_id = %s""",
+        (label_type, session_id),
+    )
+
+
+def release_labelled(project_name: str, label_type: str, cell_ids) -> None:
+    """Release the cells that have no unlabelled image left.
+
+    Without a work queue to ask every given cell is released; a session
+    that still needs one leases it again on its next renewal.
+    """
+    if LEASE_BATCH_SIZE == 0 or not has_lease_table(project_name):
+        return
+    work_queue = peek_work_queue(project_name, label_type)
+    if work_queue is not None:
+        cell_ids = [c for c in cell_ids if work_queue.cell_key(c) is None]
+    release_cells(project_name, label_type, list(cell_ids))
+
+
+class SessionLease:
+    """The batch of cells one browser session is working on.
+
+    Leases are renewed at a third of LEASE_TTL and topped up once the batch
+    is done. Streamlit does not report closed tabs, so leases of a closed
+    session end by expiry.
+    """
+
+    def __init__(
+        self,
+        project_name: str,
+        label_type: str,
+        batch_size: int = LEASE_BATCH_SIZE,
+        patient_id=None,
+    ):
+        self.project_name = project_name
+        self.label_type = label_type
+        self.batch_size = batch_size
+        self.patient_id = patient_id
+        self.session_id = uuid.uuid4().hex
+        self.cell_ids: list[int] = []
+        self.renewed_at = float("-inf")
+
+    def cells(self) -> CellIndex:
+        work_queue = get_work_queue(self.project_name, self.label_type)
+        pending = self._pending(work_queue)
+        elapsed = time.monotonic() - self.renewed_at
+        if elapsed > LEASE_TTL / 3 or (
+            not pending and elapsed > LEASE_RETRY_INTERVAL
+        ):
+            self.cell_ids = acquire_leases(
+                self.project_name,
+                self.label_type,
+                self.session_id,
+                work_queue,
+                self.batch_size,
+                patient_id=self.patient_id,
+            )
+            self.renewed_at = time.monotonic()
+            pending = self._pending(work_queue)
+            logging.info(
+                f"Leased {len(pending)} {self.label_type} cells of "
+                f"{self.project_name} to {self.session_id}"
+            )
+        return CellIndex(pending)
+
+    def release(self) -> None:
+        release_session(self.project_name, self.label_type, self.session_id)
+        self.cell_ids = []
+
+    def _pending(self, work_queue: WorkQueue) -> list:
+        cells = (work_queue.cell_key(c) for c in self.cell_ids)
+        return [cell for cell in cells if cell is not None]
+
+
+def get_session_cells(project_name: str, label_type: str) -> CellIndex:
+    """Cells the filtered selectors offer this session.
+
+    With LEASE_BATCH_SIZE=0 leasing is off and every unlabelled cell is
+    offered, as before.
+    """
+    if LEASE_BATCH_SIZE == 0:
+        return get_work_queue(project_name, label_type)
+    return _session_lease(
+        f"{label_type}_lease", SessionLease(project_name, label_type)
+    ).cells()
+
+
+def get_patient_cells(
+    project_name: str, label_type: str, patient_id, batch_size: int
+) -> CellIndex:
+    """Cells of one patient leased to this session's grid page.
+
+    The grid labels a whole page at once, so it holds its own lease of
+    batch_size cells of the patient it shows, separate from the lease of
+    the single cell pages.
+    """
+    if LEASE_BATCH_SIZE == 0:
+        return get_work_queue(project_name, label_type)
+    return _session_lease(
+        f"{label_type}_grid_lease",
+        SessionLease(project_name, label_type, batch_size, patient_id),
+    ).cells()
+
+
+def _session_lease(key: str, wanted: SessionLease) -> SessionLease:
+    """The session's lease under key, replaced if it leases other cells."""
+    lease = st.session_state.get(key)
+    target = ("project_name", "label_type", "batch_size", "patient_id")
+    if lease is None or any(
+        getattr(lease, name, None) != getattr(wanted, name) for name in target
+    ):
+        if lease is not None:
+            lease.release()
+        lease = st.session_state[key] = wanted
+    return lease
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# One JSON line per rerun; next to METRICS_FILE unless set.
+METRICS_TRACE_FILE = os.getenv(
+    "METRICS_TRACE_FILE",
+    f"{Path(METRICS_FILE).with_suffix('')}.traces.jsonl"
+    if METRICS_FILE
+    else "",
+)
+METRICS_LOG_LEVEL = os.getenv("METRICS_LOG_LEVEL", "WARNING")
+
+# The root logger is left to Streamlit, so traces get their own handler;
+# METRICS_LOG_LEVEL=INFO prints every rerun trace.
+logger = logging.getLogger("labeller.metrics")
+logger.setLevel(METRICS_LOG_LEVEL)
+# Streamlit reloads modules, and a second handler would print every line
+# twice.
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+logger.propagate = False
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    seconds: float
+    depth: int
+
+
+@dataclass
+class RerunTrace:
+    session_id: str
+    rerun: int
+    page: str
+    started_at: float = field(default_factory=time.time)
+    seconds: float = 0.0
+    spans: list[Span] = field(default_factory=list)
+    origin: float = field(default_factory=time.perf_counter)
+
+    def summary(self) -> dict[str, tuple[int, float]]:
+        """Call count and total seconds per span name."""
+        totals: dict[str, tuple[int, float]] = {}
+        for span in self.spans:
+            count, seconds = totals.get(span.name, (0, 0.0))
+            totals[span.name] = (count + 1, seconds + span.seconds)
+        return totals
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "session_id": self.session_id,
+                "rerun": self.rerun,
+                "page": self.page,
+                "started_at": self.started_at,
+                "seconds": round(self.seconds, 6),
+                "spans": [asdict(span) for span in self.spans],
+            }
+        )
+
+
+class SpanHistogram:
+    """Duration histogram per span name, exported in Prometheus format."""
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self._buckets: dict[str, list[int]] = {}
+        self._counts: dict[str, int] = {}
+        self._sums: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            buckets = self._buckets.setdefault(name, [0] * len(self.buckets))
+            for idx, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    buckets[idx] += 1
+            self._counts[name] = self._counts.get(name, 0) + 1
+            self._sums[name] = self._sums.get(name, 0.0) + seconds
+
+    def to_prometheus(self) -> str:
+        metric = "labeller_span_seconds"
+        lines = [
+            f"# HELP {metric} Duration of instrumented operations.",
+            f"# TYPE {metric} histogram",
+        ]
+        with self._lock:
+            for name in sorted(self._counts):
+                label = f'span="{name}"'
+                for bound, count in zip(self.buckets, self._buckets[name]):
+                    lines.append(
+                        f'{metric}_bucket{{{label},le="{bound}"}} {count}'
+                    )
+                count = self._counts[name]
+                lines += [
+                    f'{metric}_bucket{{{label},le="+Inf"}} {count}',
+                    f"{metric}_sum{{{label}}} {self._sums[name]:.6f}",
+                    f"{metric}_count{{{label}}} {count}",
+                ]
+        return "\n".join(lines) + "\n"
+
+
+_histogram = SpanHistogram()
+_current_trace: contextvars.ContextVar[
+    Optional[RerunTrace]
+] = contextvars.ContextVar("current_trace", default=None)
+_depth: contextvars.ContextVar[int] = contextvars.ContextVar(
+    "span_depth", default=0
+)
+
+
+def get_span_histogram() -> SpanHistogram:
+    return _histogram
+
+
+@contextmanager
+def span(name: str):
+    """Time a block into the histogram and, on a rerun thread, its trace.
+
+    Spans opened outside a rerun (e.g. prefetch workers) are only counted
+    in the histogram. Work submitted with run_in_context joins the trace of
+    the rerun that submitted it.
+    """
+    trace = _current_trace.get()
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _depth.reset(token)
+        _histogram.observe(name, seconds)
+        if trace is not None:
+            trace.spans.append(
+                Span(name, start - trace.origin, seconds, depth)
+            )
+
+
+def timed(name: str):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def run_in_context(executor, func, *args):
+    """Submit func so that its spans are recorded in the current rerun."""
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+
+@contextmanager
+def rerun_trace(session_id: str, rerun: int, page: str):
+    """Collect the spans of one Streamlit rerun, then log and export them."""
+    trace = RerunTrace(session_id, rerun, page)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.seconds = time.perf_counter() - trace.origin
+        # Spans are appended when they close; show them in start order.
+        trace.spans.sort(key=lambda s: s.start)
+        _histogram.observe("rerun", trace.seconds)
+        trace_json = trace.to_json()
+        logger.info(trace_json)
+        if METRICS_TRACE_FILE:
+            append_trace(Path(METRICS_TRACE_FILE), trace_json)
+        if METRICS_FILE:
+            write_metrics_file(Path(METRICS_FILE))
+
+
+_trace_file_lock = threading.Lock()
+
+
+def append_trace(path: Path, trace_json: str) -> None:
+    """Append one rerun to a JSONL file; reruns of all sessions share it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _trace_file_lock, open(path, "a") as f:
+        f.write(trace_json + "\n")
+
+
+def write_metrics_file(path: Path) -> None:
+    """Atomically replace the file a node exporter textfile collector reads."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(_histogram.to_prometheus())
+    os.replace(tmp, path)
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+NORMALIZE_CHUNK_BYTES = 1024**2
+
+
+def iter_chunks(
+    img: np.ndarray, chunk_bytes: int = NORMALIZE_CHUNK_BYTES
+) -> Iterator[slice]:
+    """Yield slices along the first axis covering about chunk_bytes each."""
+    if img.ndim == 0 or img.shape[0] == 0:
+        yield slice(None)
+        return
+    row_bytes = max(img[0].nbytes, 1)
+    step = max(chunk_bytes // row_bytes, 1)
+    for start in range(0, img.shape[0], step):
+        yield slice(start, start + step)
+
+
+def value_range(chunks: Iterable[np.ndarray]) -> tuple[float, float]:
+    """Min and max in one pass, reducing each chunk while it is in cache."""
+    vmin, vmax = np.inf, -np.inf
+    for chunk in chunks:
+        vmin = min(vmin, chunk.min())
+        vmax = max(vmax, chunk.max())
+    return float(vmin), float(vmax)
+
+
+def percentile_range(
+    chunks: Iterable[np.ndarray], low: float, high: float
+) -> tuple[float, float]:
+    """Percentiles via a histogram for 8/16-bit unsigned data.
+
+    Other dtypes fall back to np.percentile over the concatenated chunks.
+    """
+    counts = None
+    rest = []
+    for chunk in chunks:
+        if not has_lut(chunk.dtype):
+            rest.append(chunk.ravel())
+            continue
+        chunk_counts = np.bincount(
+            chunk.ravel(), minlength=2 ** (8 * chunk.dtype.itemsize)
+        )
+        counts = chunk_counts if counts is None else counts + chunk_counts
+
+    if rest:
+        vmin, vmax = np.percentile(np.concatenate(rest), (low, high))
+        return float(vmin), float(vmax)
+
+    cumulative = np.cumsum(counts)
+    ranks = np.array([low, high]) / 100 * (cumulative[-1] - 1)
+    vmin, vmax = np.searchsorted(cumulative, ranks, side="right")
+    return float(vmin), float(vmax)
+
+
+def build_lut(dtype: np.dtype, vmin: float, vmax: float) -> np.ndarray:
+    values = np.arange(2 ** (8 * np.dtype(dtype).itemsize), dtype=np.float64)
+    _scale_inplace(values, vmin, vmax)
+    return values.astype(np.uint8)
+
+
+def normalize_to_uint8(
+    img: np.ndarray,
+    vmin: Optional[float] = None,
+    vmax: Optional[float] = None,
+    clip_percentiles: Optional[tuple[float, float]] = None,
+    out: Optional[np.ndarray] = None,
+    chunk_bytes: int = NORMALIZE_CHUNK_BYTES,
+) -> np.ndarray:
+    """Scale img linearly so [vmin, vmax] maps to [0, 255] as uint8.
+
+    Matches ``((img - min) / (max - min) * 255).astype(np.uint8)`` without
+    full-size float64 temporaries: unsigned 8/16-bit input goes through a
+    lookup table, anything else through a reused chunk buffer. The buffer
+    is float32 for 16-bit or narrower input and float64 otherwise, so the
+    result is the same bytes. Values outside [vmin, vmax] are clipped.
+    """
+    if vmin is None or vmax is None:
+        chunks = (img[sl] for sl in iter_chunks(img, chunk_bytes))
+        low, high = (
+            value_range(chunks)
+            if clip_percentiles is None
+            else percentile_range(chunks, *clip_percentiles)
+        )
+        vmin = low if vmin is None else vmin
+        vmax = high if vmax is None else vmax
+
+    if out is None:
+        out = np.empty(img.shape, dtype=np.uint8)
+
+    if has_lut(img.dtype):
+        lut = build_lut(img.dtype, vmin, vmax)
+        for sl in iter_chunks(img, chunk_bytes):
+            np.take(lut, img[sl], out=out[sl])
+        return out
+
+    buffer_dtype = np.float32 if img.dtype.itemsize <= 2 else np.float64
+    buffer = None
+    for sl in iter_chunks(img, chunk_bytes):
+        chunk = img[sl]
+        if buffer is None or buffer.shape != chunk.shape:
+            buffer = np.empty(chunk.shape, dtype=buffer_dtype)
+        buffer[...] = chunk
+        _scale_inplace(buffer, vmin, vmax)
+        out[sl] = buffer
+    return out
+
+
+def has_lut(dtype: np.dtype) -> bool:
+    return np.dtype(dtype).kind == "u" and np.dtype(dtype).itemsize <= 2
+
+
+def _scale_inplace(buffer: np.ndarray, vmin: float, vmax: float) -> None:
+    if vmax <= vmin:
+        buffer[...] = 0
+        return
+    buffer -= vmin
+    buffer /= vmax - vmin
+    buffer *= 255
+    np.clip(buffer, 0, 255, out=buffer)
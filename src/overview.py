@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import logging
+import threading
+
+import pandas as pd
+
+from src.database import query_database
+
+OVERVIEW_IMAGE_TYPES = ["BRIGHT_FIELD", "HOLOTOMOGRAPHY"]
+OVERVIEW_QUALITIES = {
+    "Good": "q.quality = 0",
+    "Bad": "q.quality = 1",
+    "Unlabelled": "q.quality IS NULL",
+}
+
+GroupKey = tuple[int, str]
+
+
+def _count_columns() -> list[tuple[str, str, str]]:
+    return [
+        (image_type, quality, f"{image_type.lower()}_{quality.lower()}")
+        for image_type in OVERVIEW_IMAGE_TYPES
+        for quality in OVERVIEW_QUALITIES
+    ]
+
+
+def overview_sql(project_name: str, where: str = "") -> str:
+    counts = ",\n".join(
+        f"SUM(i.image_type = '{image_type}' AND "
+        f"{OVERVIEW_QUALITIES[quality]}) AS {alias}"
+        for image_type, quality, alias in _count_columns()
+    )
+    return f"""SELECT p.project_id, c.patient_id, c.cell_type,
+            {counts}
+        FROM {project_name}_image i
+        LEFT JOIN {project_name}_patient p
+        ON p.patient_id = i.patient_id
+        LEFT JOIN {project_name}_cell c
+        ON i.cell_id = c.cell_id
+        LEFT JOIN {project_name}_image_quality q
+        ON i.image_id = q.image_id
+        {where}
+        GROUP BY p.project_id, c.patient_id, c.cell_type"""
+
+
+class OverviewTable:
+    """Image counts per (patient, cell type), image type and quality.
+
+    The whole table is aggregated in SQL once; after quality labels are
+    written only the (patient, cell type) groups they touched are queried
+    again.
+    """
+
+    def __init__(self, project_name: str):
+        self.project_name = project_name
+        self._rows: dict[GroupKey, dict] = {}
+        self._dirty: set[GroupKey] = set()
+        self._lock = threading.Lock()
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        rows = query_database(overview_sql(self.project_name))
+        with self._lock:
+            self._rows = {self._key(row): row for row in rows}
+            self._dirty.clear()
+
+    def mark_dirty(self, groups) -> None:
+        with self._lock:
+            self._dirty.update(groups)
+
+    def refresh(self) -> None:
+        with self._lock:
+            dirty = list(self._dirty)
+            self._dirty.clear()
+        if not dirty:
+            return
+
+        logging.info(f"Refresh {len(dirty)} overview groups")
+        placeholders = ", ".join(["(%s, %s)"] * len(dirty))
+        rows = query_database(
+            overview_sql(
+                self.project_name,
+                f"WHERE (c.patient_id, c.cell_type) IN ({placeholders})",
+            ),
+            tuple(value for group in dirty for value in group),
+        )
+        with self._lock:
+            for group in dirty:
+                self._rows.pop(group, None)
+            self._rows.update({self._key(row): row for row in rows})
+
+    def to_frame(self) -> pd.DataFrame:
+        self.refresh()
+        with self._lock:
+            rows = list(self._rows.values())
+
+        columns = _count_columns()
+        data = pd.DataFrame(
+            rows,
+            columns=["project_id", "patient_id", "cell_type"]
+            + [alias for _, _, alias in columns],
+        )
+        data = data.set_index(["project_id", "patient_id", "cell_type"])
+        data.columns = pd.MultiIndex.from_tuples(
+            [(image_type, quality) for image_type, quality, _ in columns],
+            names=["image_type", "quality"],
+        )
+        data = data.fillna(0).astype(int).sort_index()
+        return data.loc[:, (data != 0).any()]
+
+    @staticmethod
+    def _key(row) -> GroupKey:
+        return (row["patient_id"], row["cell_type"])
+
+
+_tables: dict[str, OverviewTable] = {}
+_tables_lock = threading.Lock()
+
+
+def get_overview_table(project_name: str) -> OverviewTable:
+    with _tables_lock:
+        if project_name not in _tables:
+            _tables[project_name] = OverviewTable(project_name)
+        return _tables[project_name]
+
+
+def expire_overview_table(project_name: str) -> None:
+    """Make the next get_overview_table aggregate the whole table again."""
+    with _tables_lock:
+        _tables.pop(project_name, None)
+
+
+def mark_overview_dirty(project_name: str, groups) -> None:
+    with _tables_lock:
+        table = _tables.get(project_name)
+    if table is not None:
+        table.mark_dirty(groups)
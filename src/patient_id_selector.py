@@ -1,7 +1,9 @@
 import streamlit as st
 
-from src.database import query_database
-from src.renderer import return_selectbox_result
+from src.lease import get_session_cells
+from src.query_cache import QueryScope, cached_query
+from src.renderer import return_selectbox_result, selectbox_index
+from src.work_queue import get_work_queue
 
 
 class PatientListRenderer:
@@ -11,14 +13,19 @@ class PatientListRenderer:
         self.data_list = self.get_datalist()
 
     def get_datalist(self):
-        data_list = query_database(
-            f"SELECT patient_id FROM {self.project_name}_patient"
+        data_list = cached_query(
+            QueryScope(self.project_name),
+            f"SELECT patient_id FROM {self.project_name}_patient",
         )
 
         return return_selectbox_result([data["patient_id"] for data in data_list])  # type: ignore
 
-    def render(self):
-        return st.selectbox(self.name, self.data_list, index=0)
+    def render(self, value=None):
+        return st.selectbox(
+            self.name,
+            self.data_list,
+            index=selectbox_index(self.data_list, value),
+        )
 
 
 class FilterPatientListRenderer(PatientListRenderer):
@@ -26,43 +33,25 @@ class FilterPatientListRenderer(PatientListRenderer):
         self.label_type = label_type
         super().__init__(name, project_name)
 
-
-class FilterQualityPatientListRenderer(FilterPatientListRenderer):
     def get_datalist(self):
-        data_list = query_database(
-            f"""SELECT distinct(patient_id) 
-                FROM {self.project_name}_cell 
-                WHERE cell_id IN 
-                    (SELECT distinct(cell_id) 
-                    FROM {self.project_name}_image 
-                    WHERE image_id NOT IN (SELECT image_id FROM {self.project_name}_image_{self.label_type}))
-            """
-        )
         return return_selectbox_result(
-            [data["patient_id"] for data in data_list]
+            get_session_cells(self.project_name, self.label_type).patients()
         )
 
 
-class FilterCenterPatientListRenderer(FilterPatientListRenderer):
+class QueuePatientListRenderer(FilterPatientListRenderer):
+    """Every patient with unlabelled cells, leased to anyone or not."""
+
     def get_datalist(self):
-        data_list = query_database(
-            f"""SELECT distinct(patient_id) 
-                FROM {self.project_name}_cell 
-                WHERE cell_id IN 
-                    (SELECT distinct(cell_id) 
-                    FROM {self.project_name}_image 
-                    WHERE image_id NOT IN (SELECT image_id FROM {self.project_name}_image_{self.label_type}) AND image_type = 'HOLOTOMOGRAPHY')
-            """
-        )
         return return_selectbox_result(
-            [data["patient_id"] for data in data_list]
+            get_work_queue(self.project_name, self.label_type).patients()
         )
 
 
 class PatientListRendererFactory:
     factory_dict = {
-        "quality": FilterQualityPatientListRenderer,
-        "center": FilterCenterPatientListRenderer,
+        "quality": FilterPatientListRenderer,
+        "center": FilterPatientListRenderer,
     }
 
     def get_renderer(
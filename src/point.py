@@ -33,7 +33,8 @@ class Point:
         data = query_database(
             f"""SELECT image_id, x, y, z
                 FROM {self.project_name}_image_center 
-                WHERE image_id = {self.image_id}"""
+                WHERE image_id = %s""",
+            (self.image_id,),
         )
         logging.info(f"database point={data}")
 
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
+
+from src.image import ImageType, get_images, load_image
+from src.work_queue import CellIndex
+
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "2"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch"
+)
+
+
+class Prefetcher:
+    """Loads the images of the next cells in the selectbox in the background.
+
+    Jobs belong to a scope of (project, patient, cell type); changing the
+    scope cancels every pending job and stops running ones at the next image.
+    """
+
+    def __init__(
+        self,
+        image_types: tuple[ImageType, ...],
+        depth: int = PREFETCH_DEPTH,
+    ):
+        self.image_types = image_types
+        self.depth = depth
+        self.scope = None
+        self._jobs: dict[int, Future] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def set_scope(self, project_name, patient_id, cell_type) -> None:
+        scope = (project_name, patient_id, cell_type)
+        if scope != self.scope:
+            self.cancel()
+            self.scope = scope
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._generation += 1
+            for job in self._jobs.values():
+                _discard(job)
+            self._jobs = {}
+
+    def schedule(
+        self,
+        cells: CellIndex,
+        current_cell_number,
+        downloader_factory: Callable,
+    ) -> None:
+        """Prefetch the next depth unlabelled cells after the current one.
+
+        cells are the session's unlabelled cells, so labelled cells the
+        selectbox still lists are skipped.
+        """
+        if self.scope is None:
+            return
+        _, patient_id, cell_type = self.scope
+        try:
+            upcoming = [
+                cell_number
+                for cell_number in cells.cell_numbers(patient_id, cell_type)
+                if cell_number > current_cell_number
+            ][: self.depth]
+        except TypeError:
+            return
+
+        with self._lock:
+            for cell_number in list(self._jobs):
+                if cell_number not in upcoming:
+                    _discard(self._jobs.pop(cell_number))
+            for cell_number in upcoming:
+                if cell_number in self._jobs:
+                    continue
+                logging.info(f"Prefetch cell {cell_number}")
+                self._jobs[cell_number] = _executor.submit(
+                    self._load_cell,
+                    self.scope,
+                    cell_number,
+                    downloader_factory,
+                    self._generation,
+                )
+
+    def pop(self, cell_number) -> dict[str, np.ndarray]:
+        with self._lock:
+            job = self._jobs.pop(cell_number, None)
+        if job is None:
+            return {}
+        try:
+            images = job.result()
+        except CancelledError:
+            return {}
+        except Exception:
+            logging.exception(f"Prefetch of cell {cell_number} failed")
+            return {}
+        for image in images.values():
+            prioritize = getattr(image, "prioritize", None)
+            if prioritize is not None:
+                prioritize()
+        return images
+
+    def _load_cell(
+        self, scope, cell_number, downloader_factory, generation
+    ) -> dict[str, np.ndarray]:
+        project_name, patient_id, cell_type = scope
+        cell_images = dict(
+            zip(
+                ImageType,
+                get_images(project_name, patient_id, cell_type, cell_number),
+            )
+        )
+        downloader = downloader_factory()
+        ht_image = cell_images[ImageType.HOLOTOMOGRAPHY]
+        ht_name = None if ht_image is None else ht_image.image_name
+
+        images = {}
+        for image_type in self.image_types:
+            cell_image = cell_images[image_type]
+            if cell_image is None:
+                continue
+            if generation != self._generation:
+                return {}
+            images[cell_image.image_name] = load_image(
+                downloader,
+                cell_image.patient_name,
+                cell_image.image_name,
+                ht_name,
+                background=True,
+            )
+        return images
+
+
+def _discard(job: Future) -> None:
+    """Cancel a job and close the volumes it loads, stopping downloads."""
+    job.cancel()
+    job.add_done_callback(_close_images)
+
+
+def _close_images(job: Future) -> None:
+    if job.cancelled() or job.exception() is not None:
+        return
+    for image in job.result().values():
+        close = getattr(image, "close", None)
+        if close is not None:
+            close()
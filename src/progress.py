@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+from src.database import query_database
+
+PROGRESS_MAX_AGE = float(os.getenv("PROGRESS_MAX_AGE", "3600"))
+
+
+class ProgressCounter:
+    """Cell counts of one project and label type, kept in memory.
+
+    Counted once from the database, then updated by record_labels whenever
+    labels are written, so reading the progress is a constant-time lookup.
+    """
+
+    def __init__(self, project_name: str, label_type: str):
+        self.project_name = project_name
+        self.label_type = label_type
+        self.built_at = 0.0
+        self._lock = threading.Lock()
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        total_cell_count = query_database(
+            f"SELECT COUNT(*) FROM {self.project_name}_cell"
+        )[0].get("COUNT(*)")
+        labelled_cells = {
+            data["cell_id"]
+            for data in query_database(
+                f"""SELECT DISTINCT i.cell_id
+                    FROM {self.project_name}_image_{self.label_type} q
+                    JOIN {self.project_name}_image i
+                    ON q.image_id = i.image_id"""
+            )
+        }
+        with self._lock:
+            self.total_cell_count = total_cell_count
+            self._labelled_cells = labelled_cells
+            self.built_at = time.monotonic()
+
+    @property
+    def labelled_cell_count(self) -> int:
+        return len(self._labelled_cells)
+
+    def record_labels(self, cell_ids) -> None:
+        with self._lock:
+            self._labelled_cells.update(cell_ids)
+
+
+_counters: dict[tuple[str, str], ProgressCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_progress_counter(
+    project_name: str, label_type: str
+) -> ProgressCounter:
+    key = (project_name, label_type)
+    with _counters_lock:
+        counter = _counters.get(key)
+        if counter is None:
+            counter = _counters[key] = ProgressCounter(*key)
+        elif time.monotonic() - counter.built_at > PROGRESS_MAX_AGE:
+            counter.rebuild()
+        return counter
+
+
+def expire_progress_counter(project_name: str, label_type: str) -> None:
+    """Make the next get_progress_counter count again."""
+    with _counters_lock:
+        _counters.pop((project_name, label_type), None)
+
+
+def record_labels(project_name: str, label_type: str, cell_ids) -> None:
+    """Update the counter if it has been built; never build it on a write."""
+    with _counters_lock:
+        counter = _counters.get((project_name, label_type))
+    if counter is not None:
+        counter.record_labels(cell_ids)
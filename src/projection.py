@@ -0,0 +1,77 @@
+"""Max, min and mean projections of an HT volume along every axis.
+
+Projections are keyed "<kind>_<axis>", so "max_0" is the MIP over z. All
+nine are computed in one pass over z slabs of raw values, each reduced with
+a few numpy calls, and normalized to uint8 on their own range like a MIP
+file.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+
+from src.chunked import CHUNK_SHAPE
+from src.normalize import normalize_to_uint8
+
+PROJECTION_KINDS = ("max", "min", "mean")
+PROJECTIONS_SUFFIX = ".raw_projections.npz"
+
+
+def projection_key(kind: str, axis: int) -> str:
+    return f"{kind}_{axis}"
+
+
+def project_volume(
+    volume, depth: int = CHUNK_SHAPE[0]
+) -> dict[str, np.ndarray]:
+    """Projections of an HTVolume read depth raw planes at a time.
+
+    Along z the slab reductions are folded into running results; along y
+    and x every slab gives depth finished rows.
+    """
+    z_size = volume.shape[0]
+    running: dict[str, Optional[np.ndarray]] = dict.fromkeys(PROJECTION_KINDS)
+    rows: dict[str, list[np.ndarray]] = {
+        projection_key(kind, axis): []
+        for kind in PROJECTION_KINDS
+        for axis in (1, 2)
+    }
+
+    for z0 in range(0, z_size, depth):
+        slab = np.stack(
+            [
+                volume.read_plane(z, 0)
+                for z in range(z0, min(z0 + depth, z_size))
+            ]
+        )
+        reduced = {
+            "max": slab.max(axis=0),
+            "min": slab.min(axis=0),
+            "mean": slab.sum(axis=0, dtype=np.float64),
+        }
+        if running["max"] is None:
+            running = reduced
+        else:
+            running["max"] = np.maximum(running["max"], reduced["max"])
+            running["min"] = np.minimum(running["min"], reduced["min"])
+            running["mean"] += reduced["mean"]
+
+        for axis in (1, 2):
+            rows[projection_key("max", axis)].append(slab.max(axis=axis))
+            rows[projection_key("min", axis)].append(slab.min(axis=axis))
+            rows[projection_key("mean", axis)].append(
+                slab.mean(axis=axis, dtype=np.float64)
+            )
+
+    running["mean"] = running["mean"] / z_size
+    projections = {
+        projection_key(kind, 0): running[kind] for kind in PROJECTION_KINDS
+    }
+    projections.update(
+        {key: np.concatenate(parts) for key, parts in rows.items()}
+    )
+    return {
+        key: normalize_to_uint8(projection)
+        for key, projection in projections.items()
+    }
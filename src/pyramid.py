@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import os
+
+import numpy as np
+
+PREVIEW_WIDTH = int(os.getenv("PREVIEW_WIDTH", "350"))
+PYRAMID_MIN_SIZE = 32
+
+
+def downsample2x(img: np.ndarray) -> np.ndarray:
+    """Average 2x2 blocks of a 2D (or 2D + channels) image.
+
+    The four pixels of every block are added as strided views into one
+    output-sized accumulator: 16-bit integers for 8-bit images, float32
+    for 16-bit ones and float64 only for wider integers.
+    """
+    height, width = img.shape[0] // 2 * 2, img.shape[1] // 2 * 2
+    corners = [img[y:height:2, x:width:2] for y in (0, 1) for x in (0, 1)]
+    if img.dtype.kind == "f":
+        accumulator = np.promote_types(img.dtype, np.float32)
+    elif img.dtype.itemsize == 1:
+        accumulator = np.dtype(
+            np.int16 if img.dtype.kind == "i" else np.uint16
+        )
+    else:
+        accumulator = np.dtype(
+            np.float32 if img.dtype.itemsize == 2 else np.float64
+        )
+
+    summed = corners[0].astype(accumulator)
+    for corner in corners[1:]:
+        summed += corner
+    if accumulator.kind in "ui":
+        summed += 2
+        summed //= 4
+    else:
+        summed /= 4
+        if img.dtype.kind in "ui":
+            np.floor(summed + 0.5, out=summed)
+    return summed.astype(img.dtype)
+
+
+def fit_width(img: np.ndarray, width: int) -> np.ndarray:
+    """Halve img while it stays at least width pixels wide."""
+    while img.shape[1] // 2 >= width:
+        img = downsample2x(img)
+    return img
+
+
+class ImagePyramid:
+    """Full image plus successive 2x reductions down to PYRAMID_MIN_SIZE."""
+
+    def __init__(self, image: np.ndarray, min_size: int = PYRAMID_MIN_SIZE):
+        self.levels = [image]
+        while min(self.levels[-1].shape[:2]) // 2 >= min_size:
+            self.levels.append(downsample2x(self.levels[-1]))
+
+    @property
+    def full(self) -> np.ndarray:
+        return self.levels[0]
+
+    def level_for_width(self, width: int) -> np.ndarray:
+        """Smallest level that is still at least width pixels wide."""
+        for level in reversed(self.levels):
+            if level.shape[1] >= width:
+                return level
+        return self.full
@@ -1,21 +1,21 @@
 import streamlit as st
 
+from src.bulk_import import upsert_labels
 from src.database import Database, query_database
+from src.label_events import labels_saved
 
 
 def get_default_quality(project_name, image_id: int, key: str):
     data = query_database(
-        f"SELECT quality FROM {project_name}_image_quality WHERE image_id = {image_id}"
+        f"SELECT quality FROM {project_name}_image_quality WHERE image_id = %s",
+        (image_id,),
     )
-    st.session_state[key] = None if data is () else data[0].get("quality")
+    st.session_state[key] = data[0].get("quality") if data else None
 
 
 def save_quality(project_name, image_ids: tuple[int], quality):
-    database = Database()
     num_quality = 0 if quality == "Good" else 1
-    for image_id in image_ids:
-        sql = f"INSERT INTO {project_name}_image_quality (image_id, quality) VALUES ({image_id}, {num_quality}) ON DUPLICATE KEY UPDATE quality = {num_quality}"
-        database.execute_sql(sql)
-    database.conn.commit()
-    database.conn.close()
-
+    rows = [(image_id, num_quality) for image_id in image_ids]
+    with Database() as database, database.transaction():
+        upsert_labels(database, project_name, "quality", rows)
+    labels_saved(project_name, "quality", image_ids)
@@ -1,18 +1,22 @@
 import streamlit as st
-from src.cell_selector import render_cell_selector
-from src.image import TomocubeImage, download_image, get_images
+from src.cell_selector import cell_selected, render_cell_selector
+from src.fetch import fetch_images
+from src.image import (
+    ImageType,
+    TomocubeImage,
+    get_image_state_key,
+    get_images,
+    store_image,
+)
+from src.image_source import get_image_source
+from src.lease import get_session_cells
+from src.prefetch import Prefetcher
 from src.quality import get_default_quality, save_quality
 from src.renderer import LabelProgressRenderer, TitleRenderer
-from src.s3 import (
-    AWS_KEY,
-    AWS_PASSWORD,
-    S3Credential,
-    S3Downloader,
-    get_s3_bucket,
-)
 from src.session import set_session_state
 import logging
 
+
 def render_image_quality(quality: int) -> None:
     if quality == 0:
         st.success("Good")
@@ -22,6 +26,17 @@ def render_image_quality(quality: int) -> None:
         st.warning("No quality label")
 
 
+def render_panel(key: str, placeholder, full_resolution: bool) -> None:
+    with placeholder.container():
+        if st.session_state[f"{key}_image"] is None:
+            st.write(f"There is no {key.upper()} image")
+        else:
+            TomocubeImage.render_pyramid(
+                st.session_state[f"{key}_image_pyramid"], 350, full_resolution
+            )
+            render_image_quality(st.session_state[f"{key}_quality"])
+
+
 def app():
     label_type = "quality"
 
@@ -40,22 +55,31 @@ def app():
         "ht_image_meta_quality",
         "bf_image",
         "mip_image",
+        "bf_image_pyramid",
+        "mip_image_pyramid",
         "bf_quality",
         "mip_quality",
+        "quality_prefetcher",
     )
+    if st.session_state["quality_prefetcher"] is None:
+        st.session_state["quality_prefetcher"] = Prefetcher(
+            (ImageType.BRIGHT_FIELD, ImageType.MIP)
+        )
 
     TitleRenderer("Tomocube Image Quality Labeller").render()
 
     render_cell_selector(label_type=label_type)
 
     project_name = st.session_state[f"{label_type}_project_name"]
-    credential = S3Credential(AWS_KEY, AWS_PASSWORD)
-    bucket = get_s3_bucket(credential, project_name.replace("_", "-"))
-    downloader = S3Downloader(bucket)
 
-    if (st.session_state[f"{label_type}_cell_type"] == "Not Available") | (
-        st.session_state[f"{label_type}_cell_number"] == "Not Available"
-    ):
+    prefetcher = st.session_state["quality_prefetcher"]
+    prefetcher.set_scope(
+        project_name,
+        st.session_state[f"{label_type}_patient_id"],
+        st.session_state[f"{label_type}_cell_type"],
+    )
+
+    if not cell_selected(label_type):
         st.write("Not Available images")
         st.write(
             "Please uncheck filter out labeled or check the images really exist."
@@ -68,53 +92,50 @@ def app():
         st.session_state[f"{label_type}_cell_type"],
         st.session_state[f"{label_type}_cell_number"],
     )
-
-    if bf_cellimage != st.session_state["bf_image_meta"]:
-        if bf_cellimage is not None:
-            logging.info("Download image")
-            download_image(
-                downloader,
-                bf_cellimage.patient_name,
-                bf_cellimage.image_name,
-            )
-            st.session_state["bf_image_meta"] = bf_cellimage
-            get_default_quality(
-                st.session_state["quality_project_name"],
-                bf_cellimage.image_id,
-                "bf_quality",
-            )
+    prefetched = prefetcher.pop(st.session_state[f"{label_type}_cell_number"])
+
+    panels = {"bf": bf_cellimage, "mip": mip_cellimage}
+    stale = []
+    for key, cell_image in panels.items():
+        if cell_image is None:
+            st.session_state[f"{key}_image"] = None
+        elif cell_image != st.session_state[f"{key}_image_meta"]:
+            stale.append(cell_image)
+
+    def downloader_factory():
+        return get_image_source(project_name)
+
+    full_resolution = st.checkbox("Full resolution", value=False)
+    placeholders = dict(zip(panels, (col.empty() for col in st.columns(2))))
+    for key, cell_image in panels.items():
+        if cell_image in stale:
+            placeholders[key].info("Loading image...")
         else:
-            st.session_state["bf_image"] = None
+            render_panel(key, placeholders[key], full_resolution)
 
-    if mip_cellimage != st.session_state["mip_image_meta"]:
-        if mip_cellimage is not None:
-            download_image(
-                downloader, mip_cellimage.patient_name, mip_cellimage.image_name
-            )
-            st.session_state["mip_image_meta"] = mip_cellimage
+    # Each image is shown as soon as it is decoded instead of after all
+    # of them have been downloaded.
+    for cell_image, image in fetch_images(
+        stale, downloader_factory, prefetched, ht_cellimage
+    ):
+        logging.info(f"Loaded {cell_image.image_name}")
+        store_image(cell_image.image_name, image)
+        key = get_image_state_key(cell_image.image_name).split("_")[0]
+        st.session_state[f"{key}_image_meta"] = cell_image
+        if key == "mip":
             st.session_state["ht_image_meta_quality"] = ht_cellimage
-            get_default_quality(
-                st.session_state["quality_project_name"],
-                mip_cellimage.image_id,
-                "mip_quality",
-            )
-        else:
-            st.session_state["mip_image"] = None
-
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.session_state["bf_image"] is None:
-            st.write("There is no BF image")
-        else:
-            TomocubeImage.render(st.session_state["bf_image"], 350)
-            render_image_quality(st.session_state["bf_quality"])
+        get_default_quality(
+            st.session_state["quality_project_name"],
+            cell_image.image_id,
+            f"{key}_quality",
+        )
+        render_panel(key, placeholders[key], full_resolution)
 
-    with col2:
-        if mip_cellimage is None:
-            st.write("There is no MIP image")
-        else:
-            TomocubeImage.render(st.session_state["mip_image"], 350)
-            render_image_quality(st.session_state["mip_quality"])
+    prefetcher.schedule(
+        get_session_cells(project_name, label_type),
+        st.session_state[f"{label_type}_cell_number"],
+        downloader_factory,
+    )
 
     col1, col2, col3, col4 = st.columns(4)
     if st.session_state["bf_image"] is not None:
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from src.database import query_database
+
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+
+
+@dataclass(frozen=True)
+class QueryScope:
+    """What a cached result depends on.
+
+    label_type is set only for results that read a label table, so writes to
+    that table invalidate them. None for patient_id or cell_type means the
+    result spans every patient or cell type of the project.
+    """
+
+    project_name: str
+    label_type: Optional[str] = None
+    filtered: bool = False
+    patient_id: Optional[int] = None
+    cell_type: Optional[str] = None
+
+    def depends_on(self, project_name, label_type, patient_id, cell_type):
+        return (
+            self.project_name == project_name
+            and self.label_type == label_type
+            and self.patient_id in (None, patient_id)
+            and self.cell_type in (None, cell_type)
+        )
+
+
+class QueryCache:
+    def __init__(self, ttl: float = QUERY_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict[QueryScope, dict] = {}
+        self._key_locks: dict[tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def query(self, scope: QueryScope, sql: str, args=None):
+        key = (sql, args)
+        rows = self._get(scope, key)
+        if rows is not None:
+            return rows
+
+        # Identical concurrent queries wait for the first one instead of
+        # hitting the database again.
+        with self._key_lock(scope, key):
+            rows = self._get(scope, key)
+            if rows is not None:
+                return rows
+            with self._lock:
+                self.misses += 1
+            rows = query_database(sql, args)
+            with self._lock:
+                self._entries.setdefault(scope, {})[key] = (
+                    time.monotonic() + self.ttl,
+                    rows,
+                )
+                self._key_locks.pop((scope, key), None)
+            return rows
+
+    def invalidate(
+        self,
+        project_name: str,
+        label_type: Optional[str] = None,
+        patient_id: Optional[int] = None,
+        cell_type: Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            stale = [
+                scope
+                for scope in self._entries
+                if scope.depends_on(
+                    project_name, label_type, patient_id, cell_type
+                )
+            ]
+            for scope in stale:
+                del self._entries[scope]
+        logging.info(f"Invalidate {len(stale)} cached query scopes")
+
+    def invalidate_label_type(self, project_name: str, label_type: str):
+        """Drop every result that read the label table, for any group."""
+        with self._lock:
+            stale = [
+                scope
+                for scope in self._entries
+                if scope.project_name == project_name
+                and scope.label_type == label_type
+            ]
+            for scope in stale:
+                del self._entries[scope]
+        logging.info(f"Invalidate {len(stale)} cached query scopes")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, scope, key):
+        with self._lock:
+            entry = self._entries.get(scope, {}).get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def _key_lock(self, scope, key) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault((scope, key), threading.Lock())
+
+
+_query_cache = QueryCache()
+
+
+def get_query_cache() -> QueryCache:
+    return _query_cache
+
+
+def cached_query(scope: QueryScope, sql: str, args=None):
+    return _query_cache.query(scope, sql, args)
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import io
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+import tifffile
+
+from src.image import HTVolume
+from src.metrics import span
+from src.normalize import normalize_to_uint8
+
+REMOTE_BLOCK_SIZE = int(os.getenv("REMOTE_BLOCK_SIZE", str(256 * 1024)))
+REMOTE_DOWNLOAD_WORKERS = int(os.getenv("REMOTE_DOWNLOAD_WORKERS", "2"))
+REMOTE_PREFETCH_WORKERS = int(os.getenv("REMOTE_PREFETCH_WORKERS", "1"))
+
+# Prefetched volumes download on their own pool so they never queue ahead
+# of the volume on screen.
+_executor = ThreadPoolExecutor(
+    max_workers=REMOTE_DOWNLOAD_WORKERS, thread_name_prefix="remote-tiff"
+)
+_prefetch_executor = ThreadPoolExecutor(
+    max_workers=REMOTE_PREFETCH_WORKERS,
+    thread_name_prefix="remote-tiff-prefetch",
+)
+
+
+class RangeFile(io.RawIOBase):
+    """Seekable read-only file over ranged GETs of one bucket object.
+
+    Reads are rounded to blocks that stay cached, so tifffile parsing the
+    header and IFDs costs a few requests.
+    """
+
+    def __init__(self, bucket, key: str, block_size: int = REMOTE_BLOCK_SIZE):
+        self.bucket = bucket
+        self.key = key
+        self.block_size = block_size
+        self.length = bucket.size(key)
+        self.requests = 0
+        self._position = 0
+        self._blocks: dict[int, bytes] = {}
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position}
+        base[io.SEEK_END] = self.length
+        self._position = base[whence] + offset
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        end = min(self._position + len(buffer), self.length)
+        view = memoryview(buffer)
+        written = 0
+        while self._position < end:
+            block, offset = divmod(self._position, self.block_size)
+            data = self._block(block)[offset : offset + end - self._position]
+            view[written : written + len(data)] = data
+            written += len(data)
+            self._position += len(data)
+        return written
+
+    def read_range(self, start: int, length: int) -> bytes:
+        """One uncached GET, for data that is read only once."""
+        self.requests += 1
+        return self.bucket.get_range(self.key, start, length)
+
+    def _block(self, block: int) -> bytes:
+        if block not in self._blocks:
+            start = block * self.block_size
+            length = min(self.block_size, self.length - start)
+            self._blocks[block] = self.read_range(start, length)
+        return self._blocks[block]
+
+
+class RemoteHTVolume:
+    """HT volume whose XY planes are read from the bucket before download.
+
+    Only contiguous uncompressed series are supported: plane z then sits
+    at a fixed offset and is fetched with one range request. The whole file
+    downloads in the background; once it is there every call goes to a
+    regular HTVolume. Until then XY planes are normalized on their own
+    range and the other axes wait for the download.
+
+    A background volume downloads on the prefetch pool until prioritize
+    moves it to the front; close cancels a download that has not started.
+    """
+
+    def __init__(
+        self,
+        downloader,
+        patient_name: str,
+        image_name: str,
+        background: bool = False,
+    ):
+        self.key = f"{patient_name}/{image_name}"
+        self._file = RangeFile(downloader.bucket, self.key)
+        with tifffile.TiffFile(self._file) as tiff:
+            series = tiff.series[0]
+            page = tiff.pages[0]
+            if series.dataoffset is None or page.compression != 1:
+                raise ValueError(f"{self.key} is not contiguous")
+            self.shape = tuple(series.shape)
+            self.dtype = series.dtype.newbyteorder(tiff.byteorder)
+            self._offset = series.dataoffset
+        if len(self.shape) != 3:
+            raise ValueError(f"{self.key} is not a 3D series")
+        self.ndim = 3
+        self._plane_bytes = self.shape[1] * self.shape[2] * self.dtype.itemsize
+        logging.info(
+            f"Opened {self.key} remotely with {self._file.requests} requests"
+        )
+
+        self._volume: Optional[HTVolume] = None
+        self._lock = threading.Lock()
+        self._fetch = lambda: downloader.download(patient_name, image_name)
+        executor = _prefetch_executor if background else _executor
+        self._download: Future = executor.submit(self._fetch)
+
+    @property
+    def normalization(self) -> tuple:
+        volume = self._full_volume(wait=False)
+        if volume is None:
+            return ("per plane", None, None)
+        return volume.normalization
+
+    def take(self, indices: int, axis: int) -> np.ndarray:
+        volume = self._full_volume(wait=axis != 0)
+        if volume is not None:
+            return volume.take(indices, axis)
+        with span("remote_plane"):
+            data = self._file.read_range(
+                self._offset + indices * self._plane_bytes, self._plane_bytes
+            )
+        plane = np.frombuffer(data, self.dtype).reshape(self.shape[1:])
+        return normalize_to_uint8(plane)
+
+    def prioritize(self) -> None:
+        """Move a download still queued on the prefetch pool to the front."""
+        with self._lock:
+            if self._download.cancel():
+                self._download = _executor.submit(self._fetch)
+
+    def close(self) -> None:
+        self._download.cancel()
+        if self._volume is not None:
+            self._volume.close()
+
+    def _full_volume(self, wait: bool) -> Optional[HTVolume]:
+        with self._lock:
+            download = self._download
+        if not wait and not download.done():
+            return None
+        path = download.result()
+        with self._lock:
+            if self._volume is None:
+                self._volume = HTVolume(path)
+            return self._volume
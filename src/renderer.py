@@ -2,13 +2,18 @@ from typing import Protocol
 
 import streamlit as st
 
-from src.database import query_database
+from src.metrics import RerunTrace
+from src.progress import get_progress_counter
 
 
 def return_selectbox_result(lst):
     return lst if lst is not None else []
 
 
+def selectbox_index(lst, value) -> int:
+    return lst.index(value) if value in lst else 0
+
+
 class Renderer(Protocol):
     def render(self):
         ...
@@ -35,21 +40,9 @@ class LabelProgressRenderer:
     def __init__(self, project_name, label_type):
         self.project_name = project_name
         self.label_type = label_type
-        self.total_cell_count = self.get_total_cell_count()
-        self.total_labelled_cell_count = self.get_labelled_cell_count()
-
-    def get_labelled_cell_count(self):
-        return query_database(
-            f"""SELECT count(distinct(i.cell_id)) as cell_count 
-                FROM {self.project_name}_image_{self.label_type} q 
-                LEFT JOIN {self.project_name}_image i 
-                ON q.image_id = i.image_id"""
-        )[0].get("cell_count")
-
-    def get_total_cell_count(self) -> int:
-        return query_database(f"SELECT COUNT(*) FROM {self.project_name}_cell")[
-            0
-        ].get("COUNT(*)")
+        self.counter = get_progress_counter(project_name, label_type)
+        self.total_cell_count = self.counter.total_cell_count
+        self.total_labelled_cell_count = self.counter.labelled_cell_count
 
     def render(self):
         st.write("The number of labeled cell:", self.total_labelled_cell_count)
@@ -61,3 +54,38 @@ class LabelProgressRenderer:
             f"Progress: {self.total_labelled_cell_count / self.total_cell_count * 100:.0f}%"
         )
         st.progress(self.total_labelled_cell_count / self.total_cell_count)
+        st.button(
+            "Refresh progress",
+            on_click=self.counter.rebuild,
+            key=f"{self.label_type}_refresh_progress",
+        )
+
+
+class TimingPanelRenderer:
+    def __init__(self, trace: RerunTrace):
+        self.trace = trace
+
+    def render(self):
+        with st.expander("Timing of last rerun"):
+            st.write(f"Rerun {self.trace.rerun}: {self.trace.seconds:.3f}s")
+            st.table(
+                [
+                    {
+                        "span": name,
+                        "calls": count,
+                        "ms": round(seconds * 1000, 1),
+                        "share": f"{seconds / self.trace.seconds:.0%}",
+                    }
+                    for name, (count, seconds) in sorted(
+                        self.trace.summary().items(),
+                        key=lambda item: -item[1][1],
+                    )
+                ]
+            )
+            st.text(
+                "\n".join(
+                    f"{'  ' * span.depth}{span.name} "
+                    f"{span.seconds * 1000:.1f}ms"
+                    for span in self.trace.spans
+                )
+            )
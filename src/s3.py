@@ -1,15 +1,39 @@
 # S3 file downloader or iamge load from s3
+from __future__ import annotations
 
+import io
+import logging
 import os
+import threading
 from dataclasses import dataclass
 from pathlib import Path
+from typing import BinaryIO, Union
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from dotenv import load_dotenv
 
+from src.cache import ImageCache, InFlight, get_image_cache
+from src.metrics import timed
+from src.remote_tiff import RemoteHTVolume
+
 load_dotenv()
 AWS_KEY = os.getenv("AWS_KEY")
 AWS_PASSWORD = os.getenv("AWS_PASSWORD")
+S3_CACHE_REVALIDATE = os.getenv("S3_CACHE_REVALIDATE", "0") == "1"
+S3_IN_MEMORY = os.getenv("S3_IN_MEMORY", "0") == "1"
+S3_RANGE_READS = os.getenv("S3_RANGE_READS", "1") == "1"
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "50"))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "16"))
+S3_MULTIPART_CHUNKSIZE = int(
+    os.getenv("S3_MULTIPART_CHUNKSIZE", str(8 * 1024**2))
+)
+S3_MULTIPART_THRESHOLD = int(
+    os.getenv("S3_MULTIPART_THRESHOLD", str(8 * 1024**2))
+)
+
+_downloads = InFlight()
 
 
 @dataclass
@@ -25,43 +49,178 @@ class S3Credential:
         assert len(self.password) > 0
 
 
-def get_s3_resource(credential: S3Credential):
-    return boto3.resource(
-        "s3",
-        aws_access_key_id=credential.key,
-        aws_secret_access_key=credential.password,
+def get_transfer_config() -> TransferConfig:
+    """Large objects are fetched as parallel ranged GETs."""
+    return TransferConfig(
+        multipart_threshold=S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+        max_concurrency=S3_MAX_CONCURRENCY,
     )
 
 
-def get_s3_bucket(credential: S3Credential, name: str):
-    return get_s3_resource(credential).Bucket(name)
+class S3Bucket:
+    """Bucket operations on a shared client.
 
+    Unlike boto3 resources, clients are thread safe, so one instance serves
+    every session and prefetch thread.
+    """
 
-class S3Downloader:
-    def __init__(self, bucket) -> None:
-        self.bucket = bucket
+    def __init__(self, client, name: str, transfer_config: TransferConfig):
+        self.client = client
+        self.name = name
+        self.transfer_config = transfer_config
+
+    def e_tag(self, key: str) -> str:
+        return self.client.head_object(Bucket=self.name, Key=key)["ETag"]
+
+    def size(self, key: str) -> int:
+        response = self.client.head_object(Bucket=self.name, Key=key)
+        return response["ContentLength"]
 
-    def download(self, patient_name: str, image_name: str):
-        target_file_dict = {
-            "brightfield": Path("image", "bf.tiff"),
-            "mip": Path("image", "mip.tiff"),
-            "tomogram": Path("image", "ht.tiff"),
-        }
+    def get_range(self, key: str, start: int, length: int) -> bytes:
+        response = self.client.get_object(
+            Bucket=self.name,
+            Key=key,
+            Range=f"bytes={start}-{start + length - 1}",
+        )
+        return response["Body"].read()
+
+    def download_file(self, key: str, filename: str) -> None:
+        self.client.download_file(
+            self.name, key, filename, Config=self.transfer_config
+        )
+
+    def download_fileobj(self, key: str, fileobj) -> None:
+        self.client.download_fileobj(
+            self.name, key, fileobj, Config=self.transfer_config
+        )
 
-        for k in target_file_dict.keys():
-            if k in image_name.lower():
-                target_file = target_file_dict[k]
 
-        self.bucket.download_file(
-            f"{patient_name}/{image_name}", str(target_file)
+_clients: dict[str, object] = {}
+_buckets: dict[tuple[str, str], S3Bucket] = {}
+_clients_lock = threading.Lock()
+
+
+def get_s3_client(credential: S3Credential):
+    with _clients_lock:
+        client = _clients.get(credential.key)
+        if client is None:
+            client = _clients[credential.key] = boto3.session.Session().client(
+                "s3",
+                aws_access_key_id=credential.key,
+                aws_secret_access_key=credential.password,
+                config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS),
+            )
+        return client
+
+
+def get_s3_bucket(credential: S3Credential, name: str) -> S3Bucket:
+    client = get_s3_client(credential)
+    with _clients_lock:
+        bucket = _buckets.get((credential.key, name))
+        if bucket is None:
+            bucket = _buckets[(credential.key, name)] = S3Bucket(
+                client, name, get_transfer_config()
+            )
+        return bucket
+
+
+class S3Downloader:
+    def __init__(
+        self,
+        bucket,
+        cache: ImageCache | None = None,
+        revalidate: bool = S3_CACHE_REVALIDATE,
+        in_memory: bool = S3_IN_MEMORY,
+    ) -> None:
+        self.bucket = bucket
+        self.cache = get_image_cache() if cache is None else cache
+        self.revalidate = revalidate
+        self.in_memory = in_memory
+
+    @property
+    def name(self) -> str:
+        return self.bucket.name
+
+    def version(self, path: Path) -> str:
+        # Cached files are named after the digest of their ETag.
+        return path.stem
+
+    def fetch(
+        self, patient_name: str, image_name: str
+    ) -> Union[Path, BinaryIO]:
+        """Return a cached file if there is one, otherwise download it.
+
+        In memory mode a miss is streamed into a buffer and never written
+        to disk, so nothing is shared between concurrent sessions.
+        """
+        if not self.in_memory:
+            return self.download(patient_name, image_name)
+
+        key = f"{patient_name}/{image_name}"
+        cached = self._lookup(key)
+        return cached if cached is not None else self.stream(key)
+
+    @timed("s3.download")
+    def download(self, patient_name: str, image_name: str) -> Path:
+        key = f"{patient_name}/{image_name}"
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        # A remote volume's background download and a projection view may
+        # ask for the same file at once; the second waits for the first.
+        return _downloads.run(
+            (self.bucket.name, key),
+            lambda: self.cache.put(
+                self.bucket.name,
+                key,
+                self.bucket.e_tag(key),
+                lambda path: self.bucket.download_file(key, str(path)),
+            ),
+        )
+
+    def cached(self, patient_name: str, image_name: str) -> Path | None:
+        return self._lookup(f"{patient_name}/{image_name}")
+
+    def remote_volume(
+        self, patient_name: str, image_name: str, background: bool = False
+    ) -> RemoteHTVolume | None:
+        """Read an uncached HT volume by ranges while it downloads.
+
+        None when range reads are off, the file is cached already or its
+        layout needs the whole file.
+        """
+        if not S3_RANGE_READS or self.in_memory:
+            return None
+        if self._lookup(f"{patient_name}/{image_name}") is not None:
+            return None
+        try:
+            return RemoteHTVolume(self, patient_name, image_name, background)
+        except ValueError as e:
+            logging.info(f"Download whole volume: {e}")
+            return None
+
+    @timed("s3.stream")
+    def stream(self, key: str) -> io.BytesIO:
+        buffer = io.BytesIO()
+        self.bucket.download_fileobj(key, buffer)
+        buffer.seek(0)
+        return buffer
+
+    def _lookup(self, key: str) -> Path | None:
+        etag = self.bucket.e_tag(key) if self.revalidate else None
+        cached = self.cache.get(self.bucket.name, key, etag)
+        logging.info(
+            f"Image cache {'miss' if cached is None else 'hit'} - {key}"
         )
+        return cached
 
 
 if __name__ == "__main__":
     project_name = "2022_tomocube_igra"
     credential = S3Credential(AWS_KEY, AWS_PASSWORD)
-    resource = get_s3_resource(credential)
     bucket = get_s3_bucket(credential, project_name.replace("_", "-"))
     downloader = S3Downloader(bucket)
     image_name = "20220822.121301.809.CD4-001_RI Tomogram.tiff"
-    downloader.download("2022-tomocube-igra", "20220822", image_name)
+    print(downloader.download("20220822", image_name))
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from PIL import Image
+
+from src.image import HTVolume, TomocubeImage
+from src.metrics import span
+from src.pyramid import fit_width
+
+SLICE_CACHE_SIZE = int(os.getenv("SLICE_CACHE_SIZE", "256"))
+
+
+class SliceCache:
+    """Bounded LRU of rendered PIL slices shared by every session."""
+
+    def __init__(self, max_entries: int = SLICE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, Image.Image] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(
+        self, key: Hashable, render: Callable[[], Image.Image]
+    ) -> Image.Image:
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        image = render()
+        with self._lock:
+            self._entries[key] = image
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return image
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_slice_cache = SliceCache()
+
+
+def get_slice_cache() -> SliceCache:
+    return _slice_cache
+
+
+def get_slice_image(
+    image_key: Hashable,
+    volume: HTVolume,
+    idx: int,
+    axis: int,
+    max_width: Optional[int] = None,
+) -> Image.Image:
+    """Rendered slice, reduced to a preview level when max_width is set."""
+
+    def render():
+        with span("slice"):
+            plane = TomocubeImage.slice_axis(volume, idx, axis)
+            if max_width is not None:
+                plane = fit_width(plane, max_width)
+            return TomocubeImage.numpy_to_image(plane)
+
+    key = (image_key, axis, idx, volume.normalization, max_width)
+    return _slice_cache.get_or_render(key, render)
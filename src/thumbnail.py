@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from src.image import (
+    BFImage,
+    CellImageMeta,
+    ImageType,
+    TomocubeImage,
+    load_processed,
+)
+from src.metrics import run_in_context, span
+from src.pyramid import fit_width
+
+THUMBNAIL_WIDTH = int(os.getenv("THUMBNAIL_WIDTH", "128"))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "8"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail"
+)
+
+
+def thumbnail_key(key: str, width: int) -> str:
+    return f"{key}.thumbnail{width}.npy"
+
+
+def make_thumbnail(image: np.ndarray, width: int) -> np.ndarray:
+    """Shrink an image to about width pixels wide."""
+    return np.ascontiguousarray(fit_width(image, width))
+
+
+def make_thumbnails(images: list[np.ndarray], width: int) -> list[np.ndarray]:
+    return [make_thumbnail(image, width) for image in images]
+
+
+def load_thumbnails(
+    cell_images: list[CellImageMeta],
+    downloader_factory: Callable,
+    width: int = THUMBNAIL_WIDTH,
+) -> list[np.ndarray]:
+    """Thumbnails of BF or MIP images, in the order of cell_images.
+
+    Cached thumbnails are read back as they are; the others are made from
+    the processed image in the same job and stored next to it, so at most
+    THUMBNAIL_WORKERS full-size images are in memory at a time.
+    """
+    jobs = [
+        run_in_context(_executor, _load, downloader_factory, cell_image, width)
+        for cell_image in cell_images
+    ]
+    return [job.result() for job in jobs]
+
+
+def _load(
+    downloader_factory, cell_image: CellImageMeta, width: int
+) -> np.ndarray:
+    image_class = (
+        BFImage
+        if cell_image.image_type == ImageType.BRIGHT_FIELD.name
+        else TomocubeImage
+    )
+    return load_thumbnail(
+        downloader_factory(),
+        cell_image.patient_name,
+        cell_image.image_name,
+        image_class,
+        width,
+    )
+
+
+def load_thumbnail(
+    downloader,
+    patient_name: str,
+    image_name: str,
+    image_class,
+    width: int = THUMBNAIL_WIDTH,
+) -> np.ndarray:
+    """Thumbnail of one BF or MIP image, made and cached on a miss."""
+    key = f"{patient_name}/{image_name}"
+    image_path = downloader.fetch(patient_name, image_name)
+    if not isinstance(image_path, Path):
+        processed = image_class(image_path).process()
+        with span("thumbnail"):
+            return make_thumbnail(processed, width)
+
+    version = downloader.version(image_path)
+    cached = downloader.cache.get(
+        downloader.name, thumbnail_key(key, width), version
+    )
+    if cached is not None:
+        return np.load(cached)
+    processed = load_processed(downloader, key, image_path, image_class)
+    with span("thumbnail"):
+        thumbnail = make_thumbnail(processed, width)
+    _store(downloader, thumbnail_key(key, width), version, thumbnail)
+    return thumbnail
+
+
+def _store(downloader, key: str, version: str, thumbnail: np.ndarray) -> None:
+    def write(path: Path) -> None:
+        with open(path, "wb") as f:
+            np.save(f, thumbnail)
+
+    downloader.cache.put(downloader.name, key, version, write)
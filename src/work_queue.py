@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from src.database import query_database
+
+WORK_QUEUE_MAX_AGE = float(os.getenv("WORK_QUEUE_MAX_AGE", "3600"))
+
+LABEL_IMAGE_TYPES = {
+    "quality": None,
+    "center": "HOLOTOMOGRAPHY",
+}
+
+CellKey = tuple[int, str, int]
+
+
+class CellIndex:
+    """Sorted cells with the lookups the filtered selectors need."""
+
+    def __init__(self, cells=()):
+        self._lock = threading.RLock()
+        self._queue: list[CellKey] = sorted(cells)
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def patients(self) -> list[int]:
+        with self._lock:
+            return sorted({cell[0] for cell in self._queue})
+
+    def cell_types(self, patient_id) -> list[str]:
+        with self._lock:
+            return sorted({cell[1] for cell in self._cells_of((patient_id,))})
+
+    def cell_numbers(self, patient_id, cell_type) -> list[int]:
+        with self._lock:
+            return [
+                cell[2] for cell in self._cells_of((patient_id, cell_type))
+            ]
+
+    def next_after(
+        self, patient_id, cell_type, cell_number
+    ) -> Optional[CellKey]:
+        """First unlabelled cell after the given one, wrapping around."""
+        with self._lock:
+            if not self._queue:
+                return None
+            try:
+                idx = bisect.bisect_right(
+                    self._queue, (patient_id, cell_type, cell_number)
+                )
+            except TypeError:
+                idx = 0
+            return self._queue[idx % len(self._queue)]
+
+    def _cells_of(self, prefix: tuple) -> list[CellKey]:
+        try:
+            start = bisect.bisect_left(self._queue, prefix)
+        except TypeError:
+            return []
+        end = start
+        while (
+            end < len(self._queue)
+            and self._queue[end][: len(prefix)] == prefix
+        ):
+            end += 1
+        return self._queue[start:end]
+
+
+class WorkQueue(CellIndex):
+    """In-memory index of the cells that still have unlabelled images.
+
+    Built from one anti-join over the label table and then kept current by
+    mark_labelled, so the filtered selectors and "Next unlabelled" never
+    rescan the label tables.
+    """
+
+    def __init__(self, project_name: str, label_type: str):
+        super().__init__()
+        self.project_name = project_name
+        self.label_type = label_type
+        self.built_at = 0.0
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        image_type = LABEL_IMAGE_TYPES[self.label_type]
+        data_list = query_database(
+            f"""SELECT i.image_id, c.cell_id, c.patient_id, c.cell_type,
+                    c.cell_number
+                FROM {self.project_name}_image i
+                JOIN {self.project_name}_cell c
+                ON i.cell_id = c.cell_id
+                LEFT JOIN {self.project_name}_image_{self.label_type} l
+                ON i.image_id = l.image_id
+                WHERE l.image_id IS NULL
+                {"" if image_type is None else "AND i.image_type = %s"}""",
+            None if image_type is None else (image_type,),
+        )
+
+        with self._lock:
+            self._image_cell: dict[int, CellKey] = {}
+            self._pending: dict[CellKey, set[int]] = {}
+            self._cell_keys: dict[int, CellKey] = {}
+            for data in data_list:
+                cell = (
+                    data["patient_id"],
+                    data["cell_type"],
+                    data["cell_number"],
+                )
+                self._image_cell[data["image_id"]] = cell
+                self._pending.setdefault(cell, set()).add(data["image_id"])
+                self._cell_keys[data["cell_id"]] = cell
+            self._cell_ids = {
+                cell: cell_id for cell_id, cell in self._cell_keys.items()
+            }
+            self._queue: list[CellKey] = sorted(self._pending)
+            self.built_at = time.monotonic()
+        logging.info(
+            f"Built {self.label_type} work queue of {self.project_name}: "
+            f"{len(self._queue)} cells"
+        )
+
+    def mark_labelled(self, image_ids) -> None:
+        with self._lock:
+            for image_id in image_ids:
+                cell = self._image_cell.pop(image_id, None)
+                if cell is None:
+                    continue
+                pending = self._pending[cell]
+                pending.discard(image_id)
+                if not pending:
+                    del self._pending[cell]
+                    del self._cell_keys[self._cell_ids.pop(cell)]
+                    idx = bisect.bisect_left(self._queue, cell)
+                    del self._queue[idx]
+
+    def cell_key(self, cell_id: int) -> Optional[CellKey]:
+        """The cell's key while it has unlabelled images, else None."""
+        with self._lock:
+            return self._cell_keys.get(cell_id)
+
+    def take(self, count: int, exclude, patient_id=None) -> list[int]:
+        """cell_id of the first count cells in queue order not in exclude.
+
+        With patient_id given only that patient's cells are taken.
+        """
+        cell_ids = []
+        with self._lock:
+            cells = (
+                self._queue
+                if patient_id is None
+                else self._cells_of((patient_id,))
+            )
+            for cell in cells:
+                if len(cell_ids) == count:
+                    break
+                cell_id = self._cell_ids[cell]
+                if cell_id not in exclude:
+                    cell_ids.append(cell_id)
+        return cell_ids
+
+
+_work_queues: dict[tuple[str, str], WorkQueue] = {}
+_work_queues_lock = threading.Lock()
+
+
+def get_work_queue(project_name: str, label_type: str) -> WorkQueue:
+    key = (project_name, label_type)
+    with _work_queues_lock:
+        work_queue = _work_queues.get(key)
+        if work_queue is None:
+            work_queue = _work_queues[key] = WorkQueue(*key)
+        elif time.monotonic() - work_queue.built_at > WORK_QUEUE_MAX_AGE:
+            work_queue.rebuild()
+        return work_queue
+
+
+def expire_work_queue(project_name: str, label_type: str) -> None:
+    """Make the next get_work_queue build the queue again."""
+    with _work_queues_lock:
+        _work_queues.pop((project_name, label_type), None)
+
+
+def peek_work_queue(project_name: str, label_type: str) -> WorkQueue | None:
+    """The queue if it has been built, without building it."""
+    with _work_queues_lock:
+        return _work_queues.get((project_name, label_type))
+
+
+def mark_labelled(project_name: str, label_type: str, image_ids) -> None:
+    """Update the queue if it has been built; never build it on a write."""
+    work_queue = peek_work_queue(project_name, label_type)
+    if work_queue is not None:
+        work_queue.mark_labelled(image_ids)